@@ -1,3 +1,13 @@
+from array import array
+from bisect import bisect_right
+from functools import partial
+import hashlib
+from multiprocessing import Pool
+import os
+import pickle
+from xml.etree import ElementTree
+from xml.parsers import expat
+
 from nltk.corpus.reader.api import SyntaxCorpusReader
 from nltk.corpus.reader import xmldocs
 from nltk import tree
@@ -5,24 +15,55 @@ from nltk.util import LazyMap, LazyConcatenation
 from nltk.corpus.reader.util import concat
 
 
-def parsed(element):
+def parsed(element, simplify=False):
     """Converts a 'sentence' XML element (xml.etree.ElementTree.Element) to
-    an NLTK tree.
+    an NLTK tree, in a single iterative traversal.
 
     element -- the XML sentence element (or a subelement)
+    simplify -- whether to simplify the POS tags to their first three
+        characters (default: False).
     """
-    if element:
-        # element viewed as a list is non-empty (it has subelements)
-        subtrees = map(parsed, element)  # recursive call here!
-        subtrees = [t for t in subtrees if t is not None]
-        return tree.Tree(element.tag, subtrees)
-    else:
-        # element viewed as a list is empty. we are in a terminal.
-        if element.get('elliptic') == 'yes' and not element.get('wd'):
-            return None
+    if not len(element):
+        # the element itself is a terminal (never simplified)
+        return terminal(element)
+
+    Tree = tree.Tree
+    # stack of (element, iterator over its subelements, converted subtrees)
+    stack = [(element, iter(element), [])]
+    while True:
+        element, children, subtrees = stack[-1]
+        for child in children:
+            if len(child):
+                # go down, continue with this element later
+                stack.append((child, iter(child), []))
+                break
+            t = terminal(child, simplify)
+            if t is not None:
+                subtrees.append(t)
         else:
-            return tree.Tree(element.get('pos') or element.get('ne') or 'unk',
-                             [element.get('wd')])
+            # all the subelements done
+            stack.pop()
+            t = Tree(element.tag, subtrees)
+            if not stack:
+                return t
+            stack[-1][2].append(t)
+
+
+def terminal(element, simplify=False):
+    """Converts a terminal XML element (without subelements) to an NLTK tree
+    with a single word, or None for elliptic elements without a word.
+
+    element -- the XML element.
+    simplify -- whether to simplify the POS tag to its first three
+        characters (default: False).
+    """
+    word = element.get('wd')
+    if element.get('elliptic') == 'yes' and not word:
+        return None
+    tag = element.get('pos') or element.get('ne') or 'unk'
+    if simplify:
+        tag = tag[:3]
+    return tree.Tree(tag, [word])
 
 
 def tagged(element):
@@ -58,21 +99,436 @@ def untagged(element):
     return list(filter(lambda x: x is not None, sent))
 
 
+def convert(element, kind='parsed', simplify=False):
+    """Converts a 'sentence' XML element (xml.etree.ElementTree.Element) to
+    a sentence of some kind.
+
+    element -- the XML sentence element.
+    kind -- 'parsed' (a tree), 'tagged' (a tagged sentence) or 'untagged' (a
+        sentence) (default: 'parsed').
+    simplify -- whether to simplify the POS tags to their first three
+        characters (default: False).
+    """
+    if kind == 'parsed':
+        return parsed(element, simplify)
+    elif kind == 'tagged':
+        sent = tagged(element)
+        if simplify:
+            sent = [(w, t[:3]) for w, t in sent]
+        return sent
+    else:
+        return untagged(element)
+
+
+def iter_sents(path, kind='tagged', simplify=False):
+    """Iterates over the tagged or untagged sentences of an XML file, read
+    in a streaming fashion from the parser events. Elements are cleared once
+    their sentence is done and no trees are built, so memory use does not
+    depend on the size of the file.
+
+    path -- the XML file.
+    kind -- 'tagged' or 'untagged' (default: 'tagged').
+    simplify -- whether to simplify the POS tags to their first three
+        characters (default: False).
+    """
+    assert kind in ['tagged', 'untagged']
+    events = ElementTree.iterparse(path, events=('start', 'end'))
+    depth = 0
+    root = None
+    sent = []
+    for event, element in events:
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = element
+            continue
+        depth -= 1
+        if depth == 0:
+            # end of the document
+            break
+        if not len(element):
+            # a terminal: the same conditions as in parsed()
+            word = element.get('wd')
+            if word is not None:
+                if kind == 'tagged':
+                    tag = element.get('pos') or element.get('ne') or 'unk'
+                    if simplify:
+                        tag = tag[:3]
+                    sent.append((word, tag))
+                else:
+                    sent.append(word)
+        if depth == 1:
+            # end of a sentence (a child of the top element)
+            yield sent
+            sent = []
+            root.clear()
+
+
+def iter_elements(path):
+    """Iterates over the sentence elements (the children of the top element)
+    of an XML file, read with iterparse. Each element is cleared, with the
+    rest of the document read so far, as soon as the next one is requested,
+    so the whole document is never kept in memory.
+
+    path -- the XML file.
+    """
+    events = ElementTree.iterparse(path, events=('start', 'end'))
+    depth = 0
+    root = None
+    for event, element in events:
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = element
+            continue
+        depth -= 1
+        if depth == 1:
+            yield element
+            root.clear()
+
+
+def file_sents(path, kind='parsed', simplify=False):
+    """List of the sentences of some kind (see convert()) of an XML file.
+
+    path -- the XML file.
+    kind -- 'parsed', 'tagged' or 'untagged' (default: 'parsed').
+    simplify -- whether to simplify the POS tags to their first three
+        characters (default: False).
+    """
+    if kind == 'parsed':
+        root = ElementTree.parse(path).getroot()
+        return [convert(e, kind, simplify) for e in root]
+    else:
+        return list(iter_sents(path, kind, simplify))
+
+
+class StreamedSents(object):
+    """Iterable over the sentences of some files, in file order, read again
+    each time it is iterated. Tagged and untagged sentences are streamed with
+    iter_sents(), and parsed sentences are converted from the elements of
+    iter_elements(). With many workers, the files are converted in a process
+    pool with file_sents().
+    """
+
+    def __init__(self, paths, kind='tagged', simplify=False, workers=1):
+        """
+        paths -- the XML files.
+        kind -- 'parsed', 'tagged' or 'untagged' (default: 'tagged').
+        simplify -- whether to simplify the POS tags to their first three
+            characters (default: False).
+        workers -- number of processes (default: 1).
+        """
+        self.paths = paths
+        self.kind = kind
+        self.simplify = simplify
+        self.workers = workers
+
+    def __iter__(self):
+        kind, simplify = self.kind, self.simplify
+        if self.workers <= 1 and kind == 'parsed':
+            for path in self.paths:
+                for element in iter_elements(path):
+                    yield parsed(element, simplify)
+            return
+        elif self.workers <= 1:
+            for path in self.paths:
+                yield from iter_sents(path, kind, simplify)
+            return
+
+        f = partial(file_sents, kind=kind, simplify=simplify)
+        with Pool(self.workers) as pool:
+            # imap() returns the results in the order of the files
+            for sents in pool.imap(f, self.paths):
+                yield from sents
+
+
+def sentence_offsets(path):
+    """Encoding of an XML file and byte offsets of its sentence elements (the
+    children of the top element). Sentence i spans from offsets[i] to
+    offsets[i + 1], where the last offset is that of the end of the top
+    element.
+
+    path -- the XML file.
+    """
+    parser = expat.ParserCreate()
+    encoding = 'utf-8'
+    offsets = array('Q')
+    depth = 0
+
+    def xml_decl(version, file_encoding, standalone):
+        nonlocal encoding
+        if file_encoding:
+            encoding = file_encoding
+
+    def start(name, attrs):
+        nonlocal depth
+        depth += 1
+        if depth == 2:
+            offsets.append(parser.CurrentByteIndex)
+
+    def end(name):
+        nonlocal depth
+        depth -= 1
+        if depth == 0:
+            offsets.append(parser.CurrentByteIndex)
+
+    parser.XmlDeclHandler = xml_decl
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    with open(path, 'rb') as f:
+        parser.ParseFile(f)
+    return encoding, offsets
+
+
+class SentenceIndex(object):
+    """Persistent index of the byte offsets of the sentences of some XML
+    files (see sentence_offsets()), saved in a pickle file. The entry of a
+    file is rebuilt when its mtime or size change, and the index is marked as
+    dirty until it is saved again with save().
+    """
+
+    def __init__(self, filename):
+        """
+        filename -- the index file. It is created if it does not exist.
+        """
+        self.filename = filename
+        try:
+            with open(filename, 'rb') as f:
+                self.entries = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.entries = {}  # path -> (stamp, encoding, offsets)
+        self.dirty = False  # whether there are unsaved entries
+
+    def offsets(self, path):
+        """Encoding and sentence offsets of a file, from the index if it is
+        up to date.
+
+        path -- the absolute path of the file.
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp,) + sentence_offsets(path)
+            self.entries[path] = entry
+            self.dirty = True
+        return entry[1:]
+
+    def save(self):
+        """Save the index if it has unsaved entries."""
+        if not self.dirty:
+            return
+        tmp_filename = self.filename + '.{}.tmp'.format(os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, self.filename)
+        self.dirty = False
+
+
+class IndexedSents(object):
+    """Sequence of the sentences of some files with cheap random access:
+    indexing and slicing parse only the requested sentences, read at their
+    byte offsets in the files.
+    """
+
+    def __init__(self, paths, index, kind='parsed', simplify=False):
+        """
+        paths -- the XML files.
+        index -- the SentenceIndex.
+        kind -- 'parsed', 'tagged' or 'untagged' (default: 'parsed').
+        simplify -- whether to simplify the POS tags to their first three
+            characters (default: False).
+        """
+        self.paths = paths
+        self.kind = kind
+        self.simplify = simplify
+        self.files = [index.offsets(path) for path in paths]
+        index.save()
+        # global number of the first sentence of each file
+        self.firsts = [0]
+        for _, offsets in self.files:
+            self.firsts.append(self.firsts[-1] + len(offsets) - 1)
+
+    def __len__(self):
+        return self.firsts[-1]
+
+    def locate(self, i):
+        """File number and position in the file of a sentence.
+
+        i -- the global number of the sentence.
+        """
+        j = bisect_right(self.firsts, i) - 1
+        return j, i - self.firsts[j]
+
+    def read(self, j, positions):
+        """Convert some sentences of a file.
+
+        j -- the file number.
+        positions -- the positions of the sentences in the file.
+        """
+        encoding, offsets = self.files[j]
+        sents = []
+        with open(self.paths[j], 'rb') as f:
+            for k in positions:
+                f.seek(offsets[k])
+                data = f.read(offsets[k + 1] - offsets[k])
+                parser = ElementTree.XMLParser(encoding=encoding)
+                parser.feed(data)
+                element = parser.close()
+                sents.append(convert(element, self.kind, self.simplify))
+        return sents
+
+    def __getitem__(self, i):
+        n = len(self)
+        if isinstance(i, slice):
+            # group the sentences by file to open each file once
+            sents = []
+            last, positions = None, []
+            for j, k in map(self.locate, range(*i.indices(n))):
+                if j != last and positions:
+                    sents.extend(self.read(last, positions))
+                    positions = []
+                last = j
+                positions.append(k)
+            if positions:
+                sents.extend(self.read(last, positions))
+            return sents
+
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('sentence index out of range')
+        j, k = self.locate(i)
+        return self.read(j, [k])[0]
+
+    def __iter__(self):
+        # whole files are faster to convert at once
+        for path in self.paths:
+            yield from file_sents(path, self.kind, self.simplify)
+
+
+class StreamedWords(object):
+    """Iterable over the words of an iterable of sentences, read again each
+    time it is iterated.
+    """
+
+    def __init__(self, sents):
+        """
+        sents -- the sentences.
+        """
+        self.sents = sents
+
+    def __iter__(self):
+        for sent in self.sents:
+            yield from sent
+
+
 class AncoraCorpusReader(SyntaxCorpusReader):
 
-    def __init__(self, path, files=None):
+    # whether to simplify the POS tags to their first three characters
+    simplify = False
+
+    def __init__(self, path, files=None, cache=None, stream=False,
+                 workers=1, index=None):
+        """
+        path -- root directory of the corpus.
+        files -- regexp for the files of the corpus (default: all the
+            '.tbf.xml' files).
+        cache -- directory where the converted sentences of each file are
+            cached (default: None, no cache). Cached files are reused while
+            the path, mtime and size of the corpus file and the kind and
+            simplification of the sentences are the same.
+        stream -- read the files with iterparse, dropping each sentence
+            element (and the document) as soon as it is converted, and
+            return iterables that can only be iterated (not indexed) but use
+            constant memory (default: False). Ignored if cache is given.
+        workers -- number of processes used to convert the files (default:
+            1). If more than one, the sentences are returned as iterables as
+            with stream, in file order. Ignored if cache is given.
+        index -- file of a persistent index of the byte offsets of the
+            sentences (default: None, no index). If given, the sentences are
+            returned as sequences whose items and slices are parsed on
+            demand (see IndexedSents), and the other options are ignored.
+        """
         if files is None:
             files = '.*\.tbf\.xml'
         self.xmlreader = xmldocs.XMLCorpusReader(path, files)
+        self.cache = cache
+        self.stream = stream
+        self.workers = workers
+        self.index = SentenceIndex(index) if index is not None else None
+        if cache is not None:
+            os.makedirs(cache, exist_ok=True)
 
     def parsed_sents(self, fileids=None):
-        return LazyMap(parsed, self.elements(fileids))
+        return self.converted_sents('parsed', fileids)
 
     def tagged_sents(self, fileids=None):
-        return LazyMap(tagged, self.elements(fileids))
+        return self.converted_sents('tagged', fileids)
 
     def sents(self, fileids=None):
-        return LazyMap(untagged, self.elements(fileids))
+        return self.converted_sents('untagged', fileids)
+
+    def converted_sents(self, kind, fileids=None):
+        """Sentences of some kind (see convert()).
+
+        kind -- 'parsed', 'tagged' or 'untagged'.
+        fileids -- files to read (default: all).
+        """
+        if self.index is not None:
+            return IndexedSents(self.paths(fileids), self.index, kind,
+                                self.simplify)
+        if self.cache is None and (
+                self.workers > 1 or self.stream):
+            return StreamedSents(self.paths(fileids), kind, self.simplify,
+                                 self.workers)
+        if self.cache is None:
+            f = partial(convert, kind=kind, simplify=self.simplify)
+            return LazyMap(f, self.elements(fileids))
+
+        if not fileids:
+            fileids = self.xmlreader.fileids()
+        f = partial(self.cached_sents, kind)
+        return LazyConcatenation(LazyMap(f, fileids))
+
+    def cached_sents(self, kind, fileid):
+        """List of the sentences of some kind of a file, loaded from the
+        cache if it is up to date, or converted and cached otherwise.
+
+        kind -- 'parsed', 'tagged' or 'untagged'.
+        fileid -- the file.
+        """
+        path = self.paths([fileid])[0]
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = '{}\n{}\n{}'.format(path, kind, self.simplify)
+        filename = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pickle'
+        filename = os.path.join(self.cache, filename)
+
+        try:
+            with open(filename, 'rb') as f:
+                cached_stamp, sents = pickle.load(f)
+            if cached_stamp == stamp:
+                return sents
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+        sents = file_sents(path, kind, self.simplify)
+        tmp_filename = filename + '.{}.tmp'.format(os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump((stamp, sents), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, filename)
+        return sents
+
+    def paths(self, fileids=None):
+        """Absolute paths of some files of the corpus.
+
+        fileids -- the files (default: all).
+        """
+        if not fileids:
+            fileids = self.xmlreader.fileids()
+        return [os.path.abspath(self.xmlreader.abspath(f).path)
+                for f in fileids]
 
     def elements(self, fileids=None):
         # FIXME: skip sentence elements that will result in empty sentences!
@@ -82,7 +538,10 @@ class AncoraCorpusReader(SyntaxCorpusReader):
         return LazyConcatenation(self.xmlreader.xml(f) for f in fileids)
 
     def tagged_words(self, fileids=None):
-        return LazyConcatenation(self.tagged_sents(fileids))
+        sents = self.tagged_sents(fileids)
+        if isinstance(sents, StreamedSents):
+            return StreamedWords(sents)
+        return LazyConcatenation(sents)
 
     def __repr__(self):
         return '<AncoraCorpusReader>'
@@ -92,19 +551,4 @@ class SimpleAncoraCorpusReader(AncoraCorpusReader):
     """Ancora corpus with simplified POS tagset.
     """
 
-    def __init__(self, path, files=None):
-        super().__init__(path, files)
-
-    def tagged_sents(self, fileids=None):
-        f = lambda s: [(w, t[:3]) for w, t in s]
-        return LazyMap(f, super().tagged_sents(fileids))
-
-    def parsed_sents(self, fileids=None):
-        def f(t):
-            for p in t.treepositions('leaves'):
-                if len(p) > 1:
-                    tag = t[p[:-1]].label()
-                    t[p[:-1]].set_label(tag[:3])
-            return t
-
-        return LazyMap(f, super().parsed_sents(fileids))
+    simplify = True
@@ -0,0 +1,90 @@
+"""Benchmark the conversion of the AnCora XML sentences to trees.
+
+Compares the iterative single-pass parsed() with the former recursive
+conversion followed by the simplification of the tags, and checks that both
+give the same trees.
+
+Usage:
+  bench.py [-s] [-r <n>]
+  bench.py -h | --help
+
+Options:
+  -s            Simplify the POS tags (as SimpleAncoraCorpusReader).
+  -r <n>        Number of repetitions (the best time is reported) [default: 3].
+  -h --help     Show this screen.
+"""
+from docopt import docopt
+import sys
+import time
+
+from nltk import tree
+
+from corpus.ancora import AncoraCorpusReader, parsed
+
+
+def recursive_parsed(element):
+    """Recursive conversion of an XML element to an NLTK tree (the former
+    parsed()).
+    """
+    if element:
+        subtrees = map(recursive_parsed, element)
+        subtrees = [t for t in subtrees if t is not None]
+        return tree.Tree(element.tag, subtrees)
+    else:
+        if element.get('elliptic') == 'yes' and not element.get('wd'):
+            return None
+        else:
+            return tree.Tree(element.get('pos') or element.get('ne') or 'unk',
+                             [element.get('wd')])
+
+
+def recursive_simplified(element):
+    """Recursive conversion and then simplification of the tags."""
+    t = recursive_parsed(element)
+    for p in t.treepositions('leaves'):
+        if len(p) > 1:
+            tag = t[p[:-1]].label()
+            t[p[:-1]].set_label(tag[:3])
+    return t
+
+
+def best_time(f, elements, repetitions):
+    """Best time of some repetitions of the conversion of all the elements,
+    and the converted trees.
+    """
+    best = None
+    for _ in range(repetitions):
+        start = time.time()
+        trees = [f(e) for e in elements]
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, trees
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    simplify = opts['-s']
+    repetitions = int(opts['-r'])
+
+    print('Loading corpus...')
+    corpus = AncoraCorpusReader('ancora/ancora-2.0/')
+    elements = list(corpus.elements())
+    print('{} sentences'.format(len(elements)))
+
+    if simplify:
+        old, new = recursive_simplified, lambda e: parsed(e, True)
+    else:
+        old, new = recursive_parsed, parsed
+
+    old_time, old_trees = best_time(old, elements, repetitions)
+    print('Recursive: {:.3f}s ({:.0f} sents/s)'.format(
+        old_time, len(elements) / max(old_time, 1e-9)))
+    new_time, new_trees = best_time(new, elements, repetitions)
+    print('Iterative: {:.3f}s ({:.0f} sents/s)'.format(
+        new_time, len(elements) / max(new_time, 1e-9)))
+    print('Speedup: {:.2f}x'.format(old_time / max(new_time, 1e-9)))
+
+    if old_trees != new_trees:
+        print('ERROR: the trees differ')
+        sys.exit(1)
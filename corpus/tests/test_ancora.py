@@ -0,0 +1,247 @@
+# https://docs.python.org/3/library/unittest.html
+from unittest import TestCase
+import os
+import shutil
+import sys
+import tempfile
+from xml.etree import ElementTree
+
+import nltk
+from nltk.tree import Tree
+
+from corpus.ancora import AncoraCorpusReader, SimpleAncoraCorpusReader, \
+    SentenceIndex, IndexedSents, StreamedSents, StreamedWords, file_sents, \
+    iter_sents, iter_elements, parsed
+
+
+# tiny corpus: a UTF-8 file with elliptic, 'ne' and untagged terminals, and a
+# Latin-1 file
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ancora')
+FILES = ['a/f0.tbf.xml', 'b/f1.tbf.xml']
+
+
+class TestAncoraCorpusReader(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # newer NLTK versions only read corpora under the data paths
+        nltk.data.path.append(PATH)
+
+    @classmethod
+    def tearDownClass(cls):
+        nltk.data.path.remove(PATH)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        nltk.data.path.append(self.tmpdir.name)
+
+    def tearDown(self):
+        nltk.data.path.remove(self.tmpdir.name)
+        self.tmpdir.cleanup()
+
+    def test_tagged_sents(self):
+        corpus = AncoraCorpusReader(PATH)
+        tagged_sents = [
+            [('El', 'da0ms0'), ('niño', 'ncms000'), ('comió', 'vmis3s0'),
+             ('Juan_Pérez', 'person'), ('.', 'fp')],
+            [('él', 'pp3ms000'), ('ok', 'unk'), ('!', 'fat')],
+            [('año', 'ncms000'), ('pequeño', 'aq0ms0'), ('.', 'fp')],
+            [('Ñandú', 'np0000l')],
+        ]
+        self.assertEqual(corpus.xmlreader.fileids(), FILES)
+        self.assertEqual(list(corpus.tagged_sents()), tagged_sents)
+        self.assertEqual(list(corpus.sents()),
+                         [[w for w, _ in s] for s in tagged_sents])
+
+        corpus = SimpleAncoraCorpusReader(PATH)
+        self.assertEqual(list(corpus.tagged_sents()), [
+            [('El', 'da0'), ('niño', 'ncm'), ('comió', 'vmi'),
+             ('Juan_Pérez', 'per'), ('.', 'fp')],
+            [('él', 'pp3'), ('ok', 'unk'), ('!', 'fat')],
+            [('año', 'ncm'), ('pequeño', 'aq0'), ('.', 'fp')],
+            [('Ñandú', 'np0')],
+        ])
+
+    def test_parsed_sents(self):
+        t = Tree('sentence', [
+            Tree('S', [
+                Tree('sn', [Tree('pp3', ['él'])]),
+                Tree('unk', ['ok']),
+                Tree('fat', ['!']),
+            ]),
+        ])
+        corpus = SimpleAncoraCorpusReader(PATH)
+        parsed_sents = list(corpus.parsed_sents())
+
+        self.assertEqual(len(parsed_sents), 4)
+        self.assertEqual(parsed_sents[1], t)
+        # the elliptic 'sn' without a word is dropped
+        self.assertEqual([st.label() for st in parsed_sents[0]],
+                         ['sn', 'grup.verb', 'sn', 'fp'])
+
+    def test_parsed(self):
+        # one pass simplification: only the tags of the words
+        corpus = AncoraCorpusReader(PATH)
+        trees = list(corpus.parsed_sents())
+        for t in trees:
+            for p in t.treepositions('leaves'):
+                t[p[:-1]].set_label(t[p[:-1]].label()[:3])
+        self.assertEqual(list(SimpleAncoraCorpusReader(PATH).parsed_sents()),
+                         trees)
+
+        # deeper than the recursion limit
+        depth = sys.getrecursionlimit() + 100
+        root = element = ElementTree.Element('sentence')
+        for _ in range(depth):
+            element = ElementTree.SubElement(element, 'grup.nom')
+        ElementTree.SubElement(element, 'n', wd='Ñandú', pos='np0000l')
+        t = parsed(root, True)
+        for _ in range(depth + 1):
+            self.assertEqual(len(t), 1)
+            t = t[0]
+        self.assertEqual(t, Tree('np0', ['Ñandú']))
+
+    def all_sents(self, corpus):
+        result = []
+        for fileids in [None, ['b/f1.tbf.xml']]:
+            result.append([str(t) for t in corpus.parsed_sents(fileids)])
+            result.append(list(corpus.tagged_sents(fileids)))
+            result.append(list(corpus.sents(fileids)))
+        result.append(list(corpus.tagged_words()))
+        return result
+
+    def assertSameSents(self, **options):
+        """Check that both readers give the same sentences with some options
+        as with the default ones.
+        """
+        for cls in [AncoraCorpusReader, SimpleAncoraCorpusReader]:
+            self.assertEqual(self.all_sents(cls(PATH, **options)),
+                             self.all_sents(cls(PATH)), (cls, options))
+
+    def test_cache(self):
+        cache = os.path.join(self.tmpdir.name, 'cache')
+        self.assertSameSents(cache=cache)  # cold
+        # one file for each kind, reader class and corpus file
+        self.assertEqual(len(os.listdir(cache)), 12)
+        self.assertSameSents(cache=cache)  # warm
+        self.assertEqual(len(os.listdir(cache)), 12)
+
+    def test_cache_update(self):
+        path = os.path.join(self.tmpdir.name, 'corpus')
+        shutil.copytree(PATH, path)
+        cache = os.path.join(self.tmpdir.name, 'cache')
+        corpus = AncoraCorpusReader(path, cache=cache)
+        self.assertEqual(len(list(corpus.sents())), 4)
+
+        # remove the last sentence of the Latin-1 file
+        filename = os.path.join(path, 'b', 'f1.tbf.xml')
+        with open(filename, 'rb') as f:
+            data = f.read()
+        start = data.index(b'<sentence><n ')
+        end = data.index(b'</article>')
+        with open(filename, 'wb') as f:
+            f.write(data[:start] + data[end:])
+
+        corpus = AncoraCorpusReader(path, cache=cache)
+        self.assertEqual(list(corpus.sents())[2:], [['año', 'pequeño', '.']])
+
+    def test_stream(self):
+        self.assertSameSents(stream=True)
+
+        # streamed sentences are read again each time they are iterated
+        sents = AncoraCorpusReader(PATH, stream=True).tagged_sents()
+        self.assertIsInstance(sents, StreamedSents)
+        self.assertEqual(list(sents), list(sents))
+
+    def test_iter_sents(self):
+        corpus = AncoraCorpusReader(PATH)
+        for filename in FILES:
+            path = os.path.join(PATH, filename)
+            self.assertEqual(list(iter_sents(path, 'tagged')),
+                             list(corpus.tagged_sents([filename])))
+            self.assertEqual(list(iter_sents(path, 'untagged')),
+                             list(corpus.sents([filename])))
+            self.assertEqual(list(iter_sents(path, 'tagged', True)),
+                             [[(w, t[:3]) for w, t in s]
+                              for s in corpus.tagged_sents([filename])])
+
+    def test_workers(self):
+        self.assertSameSents(workers=2)
+        self.assertSameSents(workers=2, stream=True)
+
+    def test_file_sents(self):
+        corpus = SimpleAncoraCorpusReader(PATH)
+        for filename in FILES:
+            path = os.path.join(PATH, filename)
+            for kind in ['parsed', 'tagged', 'untagged']:
+                sents = list(corpus.converted_sents(kind, [filename]))
+                self.assertEqual(file_sents(path, kind, True), sents,
+                                 (filename, kind))
+
+    def test_index(self):
+        filename = os.path.join(self.tmpdir.name, 'index.pickle')
+        self.assertSameSents(index=filename)  # built
+        self.assertSameSents(index=filename)  # loaded
+
+        corpus = SimpleAncoraCorpusReader(PATH)
+        indexed = SimpleAncoraCorpusReader(PATH, index=filename)
+
+        for kind in ['parsed_sents', 'tagged_sents', 'sents']:
+            sents = list(getattr(corpus, kind)())
+            indexed_sents = getattr(indexed, kind)()
+            self.assertEqual(len(indexed_sents), len(sents))
+            for i in range(-len(sents), len(sents)):
+                self.assertEqual(indexed_sents[i], sents[i], (kind, i))
+            for s in [slice(None), slice(1, 3), slice(None, None, -1),
+                      slice(-1, 0, -2), slice(3, 100), slice(2, 2)]:
+                self.assertEqual(indexed_sents[s], sents[s], (kind, s))
+            with self.assertRaises(IndexError):
+                indexed_sents[len(sents)]
+            with self.assertRaises(IndexError):
+                indexed_sents[-len(sents) - 1]
+
+    def test_index_update(self):
+        filename = os.path.join(self.tmpdir.name, 'f.tbf.xml')
+        with open(filename, 'wb') as f:
+            f.write(b'<article><sentence><n wd="a" pos="x"/></sentence>'
+                    b'<sentence><n wd="b" pos="y"/></sentence></article>')
+        index_filename = os.path.join(self.tmpdir.name, 'index.pickle')
+        index = SentenceIndex(index_filename)
+        sents = IndexedSents([filename], index, 'untagged')
+        self.assertEqual(sents[:], [['a'], ['b']])
+
+        # a new index loads the offsets saved by the first one
+        self.assertEqual(SentenceIndex(index_filename).entries, index.entries)
+
+        # an up to date index is not saved again
+        os.remove(index_filename)
+        IndexedSents([filename], index, 'untagged')
+        self.assertFalse(os.path.exists(index_filename))
+
+        # a changed file is indexed again
+        with open(filename, 'wb') as f:
+            f.write(b'<article><sentence><n wd="c" pos="x"/></sentence>'
+                    b'</article>')
+        sents = IndexedSents([filename], SentenceIndex(index_filename),
+                             'untagged')
+        self.assertEqual(len(sents), 1)
+        self.assertEqual(sents[0], ['c'])
+
+    def test_iter_elements(self):
+        corpus = AncoraCorpusReader(PATH)
+        for filename in FILES:
+            path = os.path.join(PATH, filename)
+            trees = [parsed(e) for e in iter_elements(path)]
+            self.assertEqual(trees, list(corpus.parsed_sents([filename])))
+
+    def test_stream_parsed(self):
+        corpus = SimpleAncoraCorpusReader(PATH, stream=True)
+        default = SimpleAncoraCorpusReader(PATH)
+
+        sents = corpus.parsed_sents()
+        self.assertIsInstance(sents, StreamedSents)
+        self.assertEqual(list(sents), list(default.parsed_sents()))
+        words = corpus.tagged_words()
+        self.assertIsInstance(words, StreamedWords)
+        self.assertEqual(list(words), list(default.tagged_words()))
+        self.assertEqual(list(words), list(words))
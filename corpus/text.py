@@ -0,0 +1,13 @@
+def line_sents(filename, encoding='utf-8'):
+    """Iterate over the sentences of a tokenized text file, reading one line
+    at a time. Each line is a sentence with its tokens separated by
+    whitespace. Empty lines are skipped.
+
+    filename -- the text file.
+    encoding -- encoding of the file (default: 'utf-8').
+    """
+    with open(filename, encoding=encoding) as f:
+        for line in f:
+            sent = line.split()
+            if sent:
+                yield sent
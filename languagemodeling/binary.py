@@ -0,0 +1,466 @@
+"""Binary memory-mapped format for n-gram models.
+
+A model file has a header, a vocabulary and one count table for each order
+of n-grams in the model:
+
+  header  -- magic b'PLNNGRAM', format version, n, vocabulary size, number
+             of tables, count of the empty n-gram, bits used for the
+             probabilities (0 for doubles, or 8 or 16 if quantized) and
+             size of the codebook.
+  tables  -- for each table: order, offset and number of records.
+  codebook -- only for quantized probabilities: the probabilities (doubles)
+             the codes stand for.
+  vocab   -- (V + 1) offsets followed by the UTF-8 encoded tokens, sorted by
+             their encoding. The id of a token is its position.
+  table   -- sorted fixed-size records, each one being the big-endian 32-bit
+             token ids of an n-gram, its count and, for the n-grams of the
+             highest order, its conditional probability (a double, or its
+             code in the codebook if quantized).
+
+Files are loaded with mmap, so loading is immediate and the processes that
+load the same file share its pages.
+
+Models are saved in two passes over their counts, so that only the
+vocabulary is kept in memory: the first one collects the vocabulary and the
+sizes of the tables, and the second one writes the records to sorted runs of
+at most RUN_SIZE records, which are then merged into the model file.
+"""
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from collections import defaultdict
+from math import log2
+
+from languagemodeling.counts import bisect_records, key_struct
+from languagemodeling.ngram import NGram
+
+
+MAGIC = b'PLNNGRAM'
+VERSION = 2
+HEADER = struct.Struct('>8sIIQIQII')
+TABLE = struct.Struct('>IQQ')
+OFFSET = struct.Struct('>Q')
+COUNT = struct.Struct('>I')
+PROB = struct.Struct('>d')
+CODES = {8: struct.Struct('>B'), 16: struct.Struct('>H')}
+# number of records sorted in memory at a time by save()
+RUN_SIZE = 2 ** 18
+
+
+def save(model, filename, bits=0):
+    """Save an n-gram model in the binary format.
+
+    model -- the NGram model.
+    filename -- the output file.
+    bits -- bits used to quantize the conditional probabilities: 0 to store
+        them as doubles, 8 or 16 (default: 0).
+    """
+    assert bits == 0 or bits in CODES
+    n = model.n
+    counts = model.counts
+    quantizer = Quantizer(bits) if bits else None
+
+    def prob(ngram):
+        return model.cond_prob(ngram[-1], list(ngram[:-1]))
+
+    # first pass: vocabulary, sizes of the tables and, if quantizing, the
+    # probabilities
+    tokens = set()
+    sizes = defaultdict(int)
+    empty = 0
+    for ngram, c in counts.items():
+        if not ngram:
+            empty = c
+        elif c:
+            sizes[len(ngram)] += 1
+            tokens.update(ngram)
+            if quantizer is not None and len(ngram) == n:
+                quantizer.add(prob(ngram))
+
+    # vocabulary sorted by the encoded tokens
+    encoded = sorted(token.encode('utf-8') for token in tokens)
+    del tokens
+    ids = {token.decode('utf-8'): i for i, token in enumerate(encoded)}
+    orders = sorted(sizes)
+    prob_format = CODES[bits] if bits else PROB
+
+    with tempfile.TemporaryDirectory(prefix='ngram-save-') as path:
+        # second pass: sorted runs of the records of each order
+        runs = defaultdict(list)  # order -> list of run files
+        records = defaultdict(list)  # order -> records of the next run
+        for ngram, c in counts.items():
+            if not ngram or not c:
+                continue
+            k = len(ngram)
+            record = key_struct(k).pack(*[ids[t] for t in ngram])
+            record += COUNT.pack(c)
+            if k == n:
+                p = prob(ngram)
+                if quantizer is not None:
+                    p = quantizer.code(p)
+                record += prob_format.pack(p)
+            k_records = records[k]
+            k_records.append(record)
+            if len(k_records) >= RUN_SIZE:
+                runs[k].append(write_run(path, k, len(runs[k]), k_records))
+                k_records.clear()
+        for k, k_records in records.items():
+            if k_records:
+                runs[k].append(write_run(path, k, len(runs[k]), k_records))
+        del records
+        codebook = quantizer.codebook() if quantizer is not None else []
+
+        with open(filename, 'wb') as f:
+            offset = HEADER.size + TABLE.size * len(orders)
+            offset += PROB.size * len(codebook)
+            offset += OFFSET.size * (len(encoded) + 1)
+            offset += sum(len(token) for token in encoded)
+
+            f.write(HEADER.pack(MAGIC, VERSION, n, len(encoded), len(orders),
+                                empty, bits, len(codebook)))
+            for k in orders:
+                f.write(TABLE.pack(k, offset, sizes[k]))
+                offset += sizes[k] * record_size(k, n, bits)
+            for p in codebook:
+                f.write(PROB.pack(p))
+
+            # vocabulary
+            token_offset = 0
+            for token in encoded:
+                f.write(OFFSET.pack(token_offset))
+                token_offset += len(token)
+            f.write(OFFSET.pack(token_offset))
+            for token in encoded:
+                f.write(token)
+
+            # tables, merging the runs
+            for k in orders:
+                size = record_size(k, n, bits)
+                if len(runs[k]) == 1:
+                    with open(runs[k][0], 'rb') as run:
+                        shutil.copyfileobj(run, f)
+                else:
+                    f.writelines(heapq.merge(
+                        *[read_run(run, size) for run in runs[k]]))
+                for run in runs[k]:
+                    os.remove(run)
+
+
+def write_run(path, k, i, records):
+    """Sort some records and write them to a run file. Returns the name of
+    the file.
+
+    path -- directory of the run files.
+    k -- order of the n-grams of the records.
+    i -- number of the run of the order.
+    records -- list of records.
+    """
+    records.sort()
+    filename = os.path.join(path, '{}-{}.run'.format(k, i))
+    with open(filename, 'wb') as f:
+        f.writelines(records)
+    return filename
+
+
+def read_run(filename, size, block=2 ** 12):
+    """Iterate over the records of a run file.
+
+    filename -- the run file.
+    size -- size of the records.
+    block -- number of records read at a time (default: 2 ** 12).
+    """
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(size * block)
+            if not data:
+                break
+            for i in range(0, len(data), size):
+                yield data[i: i + size]
+
+
+def load(filename, cache_size=None):
+    """Load an n-gram model saved in the binary format.
+
+    filename -- the model file.
+    cache_size -- size of an LRU cache for cond_prob() (default: None,
+        no cache).
+    """
+    return MappedNGram(filename, cache_size)
+
+
+def record_size(k, n, bits=0):
+    """Size in bytes of the records of a table.
+
+    k -- order of the n-grams in the table.
+    n -- order of the model.
+    bits -- bits used for the probabilities (default: 0, doubles).
+    """
+    size = 4 * k + COUNT.size
+    if k == n:
+        size += CODES[bits].size if bits else PROB.size
+    return size
+
+
+def quantize(probs, bits):
+    """Quantize probabilities to codes of some bits. Returns the codebook (the
+    probability each code stands for) and the code of each probability.
+    See Quantizer.
+
+    probs -- list of non-zero probabilities.
+    bits -- bits of the codes.
+    """
+    quantizer = Quantizer(bits)
+    for p in probs:
+        quantizer.add(p)
+    codes = [quantizer.code(p) for p in probs]
+    return quantizer.codebook(), codes
+
+
+class Quantizer(object):
+    """Quantizer of probabilities to codes of some bits, in two passes: all
+    the probabilities are given to add() and then to code(), and finally
+    codebook() gives the probability each code stands for. Only the range of
+    the probabilities (and at most 2 ** bits of them) is kept in memory.
+
+    If there are at most 2 ** bits distinct probabilities, the codebook has
+    them all and the quantization is exact. Otherwise, the range of the
+    log-probabilities is split in 2 ** bits equal-width bins, each one
+    standing for the mean log-probability of its members.
+    """
+
+    def __init__(self, bits):
+        """
+        bits -- bits of the codes.
+        """
+        self.levels = 2 ** bits
+        self.distinct = set()  # the probabilities, None if too many
+        self.lo = self.hi = None  # range of the log-probabilities
+        self.codes = None  # probability -> code, if exact
+        self.sums = [0.0] * self.levels
+        self.sizes = [0] * self.levels
+
+    def add(self, p):
+        """First pass: add a probability.
+
+        p -- the non-zero probability.
+        """
+        if self.distinct is not None:
+            self.distinct.add(p)
+            if len(self.distinct) > self.levels:
+                self.distinct = None
+        lp = log2(p)
+        if self.lo is None or lp < self.lo:
+            self.lo = lp
+        if self.hi is None or lp > self.hi:
+            self.hi = lp
+
+    def code(self, p):
+        """Second pass: code of a probability.
+
+        p -- the probability, given to add() in the first pass.
+        """
+        if self.distinct is not None:
+            if self.codes is None:
+                distinct = sorted(self.distinct)
+                self.codes = {p: i for i, p in enumerate(distinct)}
+            return self.codes[p]
+        lp = log2(p)
+        code = int((lp - self.lo) / self._width() + 0.5)
+        self.sums[code] += lp
+        self.sizes[code] += 1
+        return code
+
+    def codebook(self):
+        """Probability each code stands for, after the second pass."""
+        if self.distinct is not None:
+            return sorted(self.distinct)
+        lo, width = self.lo, self._width()
+        sums, sizes = self.sums, self.sizes
+        return [2 ** (sums[i] / sizes[i] if sizes[i] else lo + i * width)
+                for i in range(self.levels)]
+
+    def _width(self):
+        """Width of the bins of log-probabilities."""
+        return (self.hi - self.lo) / (self.levels - 1) or 1.0
+
+
+class MappedNGram(NGram):
+    """N-gram model read from a memory-mapped binary model file."""
+
+    def __init__(self, filename, cache_size=None):
+        """
+        filename -- the model file.
+        cache_size -- size of an LRU cache for cond_prob() (default: None,
+            no cache).
+        """
+        self.filename = filename
+        self.set_cache(cache_size)
+        with open(filename, 'rb') as f:
+            self.data = data = mmap.mmap(f.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+
+        if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a binary n-gram model'.format(
+                filename))
+        version = COUNT.unpack_from(data, len(MAGIC))[0]
+        if version != VERSION:
+            raise ValueError('unsupported binary model version {}'.format(
+                version))
+        _, _, n, V, n_tables, empty, bits, codebook_size = \
+            HEADER.unpack_from(data, 0)
+        offset = HEADER.size
+        self.n = n
+        self.empty = empty
+        self.bits = bits
+
+        self.tables = {}  # order -> (offset, number of records)
+        for _ in range(n_tables):
+            k, table_offset, size = TABLE.unpack_from(data, offset)
+            self.tables[k] = (table_offset, size)
+            offset += TABLE.size
+
+        self.codebook_offset = offset
+        offset += PROB.size * codebook_size
+
+        self.vocab_size = V
+        self.vocab_offset = offset
+        self.tokens_offset = offset + OFFSET.size * (V + 1)
+
+    def token(self, i):
+        """Token with a given id.
+
+        i -- the id.
+        """
+        data, offset = self.data, self.vocab_offset + OFFSET.size * i
+        start, end = struct.unpack_from('>QQ', data, offset)
+        start += self.tokens_offset
+        return data[start: self.tokens_offset + end].decode('utf-8')
+
+    def token_id(self, token):
+        """Id of a token, or None if it is not in the vocabulary.
+
+        token -- the token.
+        """
+        data = self.data
+        encoded = token.encode('utf-8')
+        lo, hi = 0, self.vocab_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = self.vocab_offset + OFFSET.size * mid
+            start, end = struct.unpack_from('>QQ', data, offset)
+            t = data[self.tokens_offset + start: self.tokens_offset + end]
+            if t < encoded:
+                lo = mid + 1
+            elif t > encoded:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def key(self, tokens):
+        """Key of an n-gram (its token ids as bytes), or None if it has
+        unknown tokens.
+
+        tokens -- the n-gram.
+        """
+        key = []
+        for token in tokens:
+            i = self.token_id(token)
+            if i is None:
+                return None
+            key.append(i.to_bytes(4, 'big'))
+        return b''.join(key)
+
+    def find(self, tokens):
+        """Offset of the record of an n-gram, or None if not found.
+
+        tokens -- the n-gram.
+        """
+        k = len(tokens)
+        table = self.tables.get(k)
+        key = self.key(tokens)
+        if table is None or key is None:
+            return None
+
+        data = self.data
+        offset, size = table
+        rsize = record_size(k, self.n, self.bits)
+        i = offset + bisect_records(data, offset, size, rsize, key) * rsize
+        if i < offset + size * rsize and data[i: i + len(key)] == key:
+            return i
+        return None
+
+    def successors(self, prev_tokens):
+        """List of (token, count) pairs for the n-grams that extend a
+        context, found with two binary searches.
+
+        prev_tokens -- the context.
+        """
+        k = len(prev_tokens) + 1
+        table = self.tables.get(k)
+        prefix = self.key(prev_tokens)
+        if table is None or prefix is None:
+            return []
+
+        data = self.data
+        offset, size = table
+        rsize = record_size(k, self.n, self.bits)
+        lo = bisect_records(data, offset, size, rsize, prefix)
+        hi = bisect_records(data, offset, size, rsize, prefix, right=True)
+        result = []
+        for i in range(offset + lo * rsize, offset + hi * rsize, rsize):
+            token, c = struct.unpack_from('>II', data, i + 4 * (k - 1))
+            result.append((self.token(token), c))
+        return result
+
+    def count(self, tokens):
+        """Count for an n-gram or (n-1)-gram.
+
+        tokens -- the n-gram or (n-1)-gram tuple.
+        """
+        if not tokens:
+            return self.empty
+        i = self.find(tokens)
+        if i is None:
+            return 0
+        return COUNT.unpack_from(self.data, i + 4 * len(tokens))[0]
+
+    def _cond_prob(self, token, prev_tokens=None):
+        """Conditional probability of a token, without using the cache.
+
+        token -- the token.
+        prev_tokens -- the previous n-1 tokens (optional only if n = 1).
+        """
+        n = self.n
+        if not prev_tokens:
+            prev_tokens = []
+        assert len(prev_tokens) == n - 1
+
+        i = self.find(list(prev_tokens) + [token])
+        if i is None:
+            return 0.0
+        i += 4 * n + COUNT.size
+        if self.bits:
+            code = CODES[self.bits].unpack_from(self.data, i)[0]
+            i = self.codebook_offset + PROB.size * code
+        return PROB.unpack_from(self.data, i)[0]
+
+    def update(self, sents, workers=1, chunk_size=10000):
+        """Binary models are read-only: update the NGram model and save it
+        again instead.
+        """
+        raise TypeError('binary models are read-only')
+
+    def close(self):
+        self.data.close()
+
+    def __getstate__(self):
+        # only the file name: unpickling maps the file again
+        cache_size = self.cache.size if self.cache is not None else None
+        return {'filename': self.filename, 'cache_size': cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['filename'], state.get('cache_size'))
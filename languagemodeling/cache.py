@@ -0,0 +1,70 @@
+# https://docs.python.org/3/library/collections.html
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """Bounded mapping that evicts the least recently used entries. It is safe
+    to use from many threads.
+    """
+
+    def __init__(self, size):
+        """
+        size -- maximum number of entries.
+        """
+        assert size > 0
+        self.size = size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Value of a key, marking it as recently used, or default if the key
+        is not in the cache.
+
+        key -- the key.
+        default -- value for missing keys (default: None).
+        """
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store the value of a key, evicting the least recently used entry if
+        the cache is full.
+
+        key -- the key.
+        value -- the value.
+        """
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        """Remove all the entries (the counters are kept)."""
+        with self.lock:
+            self.data.clear()
+
+    def hit_rate(self):
+        """Fraction of the lookups that were hits."""
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getstate__(self):
+        # the entries and the lock are not pickled
+        return {'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['size'])
@@ -0,0 +1,658 @@
+"""Compact storage for n-gram counts.
+
+Tokens are mapped to integer ids using a vocabulary, and each n-gram is
+stored as a fixed-size record of big-endian 32-bit token ids, so the byte
+order of the records is the order of the n-grams. The counts of each order
+are kept in a log-structured set of sorted runs, each one a pair of arrays
+(records and counts). Runs are queried with a sparse index of the first
+record of each block of INDEX_EVERY records, searched with the bisect module,
+and a search of the record within its block with bytes.find(), so lookups
+run in C rather than in a Python binary search.
+
+For corpora whose counts do not fit in memory, DiskCounts spills sorted runs
+of counts to files and merges them into sorted count tables on disk.
+"""
+# https://docs.python.org/3/library/array.html
+from array import array
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from functools import lru_cache
+import heapq
+from itertools import islice
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import weakref
+
+
+# bits used for each token id in the records
+ID_BITS = 32
+# number of additions between checks of the size of the pending counts
+CHECK_EVERY = 2 ** 16
+# approximate memory used by each pending n-gram, in bytes
+PENDING_SIZE = 200
+# number of records of the runs for each entry of their sparse index
+INDEX_EVERY = 32
+
+
+class Vocabulary(object):
+
+    def __init__(self, tokens=()):
+        """
+        tokens -- initial tokens (optional).
+        """
+        self.ids = {}
+        self.tokens = []
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token):
+        """Add a token to the vocabulary (if not already there) and return its
+        id.
+
+        token -- the token.
+        """
+        i = self.ids.get(token)
+        if i is None:
+            i = self.ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return i
+
+    def get(self, token):
+        """Id of a token, or None if it is not in the vocabulary.
+
+        token -- the token.
+        """
+        return self.ids.get(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.ids
+
+
+class CompactCounts(object):
+    """N-gram counts stored in sorted arrays of fixed-size records.
+
+    Behaves like a read-only mapping from n-gram tuples to counts, where
+    missing n-grams have count 0. N-grams are added with add() or update()
+    and become visible to queries after freeze() (called automatically on
+    the first query).
+
+    Each freeze() adds a new sorted run, and runs are merged while the
+    previous run is not larger than the last one, so there are at most
+    O(log n) runs of decreasing sizes and a small update never rebuilds the
+    large runs.
+    """
+
+    def __init__(self, counts=None, vocab=None, max_pending=2 ** 18):
+        """
+        counts -- mapping from n-gram tuples to counts to load (optional).
+        vocab -- vocabulary to share with other tables (optional).
+        max_pending -- number of distinct pending n-grams that triggers a
+            freeze() during update(), bounding the memory used while
+            counting (default: 2 ** 18).
+        """
+        self.vocab = vocab if vocab is not None else Vocabulary()
+        self.max_pending = max_pending
+        self.runs = {}  # order -> list of (records, counts) runs
+        self.empty = 0  # count of the empty n-gram ()
+        self._pending = Counter()  # n-gram tuple -> count
+        self._indexes = {}  # order -> sparse indexes of the first runs
+
+        if counts is not None:
+            for ngram, c in counts.items():
+                self.add(ngram, c)
+            self.freeze()
+
+    def add(self, ngram, count=1):
+        """Add to the count of an n-gram.
+
+        ngram -- the n-gram tuple.
+        count -- amount to add (default: 1).
+        """
+        self._pending[tuple(ngram)] += count
+
+    def update(self, ngrams):
+        """Add one to the count of each n-gram and freeze the table.
+
+        ngrams -- iterable of n-gram tuples.
+        """
+        ngrams = iter(ngrams)
+        while True:
+            # Counter.update() counts a batch in C
+            batch = list(islice(ngrams, CHECK_EVERY))
+            if not batch:
+                break
+            self._pending.update(batch)
+            if len(self._pending) >= self.max_pending:
+                self.freeze()
+        self.freeze()
+
+    def add_counts(self, counts):
+        """Add the counts of a mapping, freezing the table if max_pending is
+        reached.
+
+        counts -- mapping from n-gram tuples to counts.
+        """
+        self._pending.update(counts)
+        if len(self._pending) >= self.max_pending:
+            self.freeze()
+
+    def pending_size(self):
+        """Number of distinct n-grams added but not yet frozen."""
+        return len(self._pending)
+
+    def freeze(self):
+        """Add the pending counts as a new sorted run, merging the runs of
+        similar sizes.
+        """
+        for k, items in self._sorted_pending().items():
+            run = make_run(items, k)
+            del items
+            self._add_run(k, run)
+
+    def add_runs(self, k, runs):
+        """Add sorted runs of n-grams of an order, with records made with
+        the ids of the vocabulary. A run whose records all follow those of
+        the last run of the order (as the runs of disjoint key ranges do) is
+        appended to it, the rest are merged as in freeze().
+
+        k -- the order.
+        runs -- iterable of (records, counts) runs.
+        """
+        size = 4 * k
+        table_runs = self.runs.setdefault(k, [])
+        for records, counts in runs:
+            if not counts:
+                continue
+            if table_runs and table_runs[-1][0][-size:] < records[:size]:
+                last_records, last_counts = table_runs.pop()
+                if not isinstance(last_records, bytearray):
+                    last_records = bytearray(last_records)
+                last_records += records
+                last_counts.extend(counts)
+                records, counts = last_records, last_counts
+            self._add_run(k, (records, counts))
+
+    def merge(self):
+        """Merge the runs of each order into a single run."""
+        if self._pending:
+            self.freeze()
+        for k, runs in self.runs.items():
+            if len(runs) > 1:
+                self._indexes.pop(k, None)
+            while len(runs) > 1:
+                run = merge_runs(runs[-2], runs[-1], 4 * k)
+                runs[-2:] = [run]
+
+    def key(self, ngram):
+        """Record of an n-gram (its token ids as bytes), or None if it has
+        unknown tokens.
+
+        ngram -- the n-gram tuple.
+        """
+        ids = list(map(self.vocab.ids.get, ngram))
+        if None in ids:
+            return None
+        return key_struct(len(ids)).pack(*ids)
+
+    def ngram(self, key):
+        """N-gram tuple of a record.
+
+        key -- the record.
+        """
+        tokens = self.vocab.tokens
+        return tuple(tokens[int.from_bytes(key[j: j + 4], 'big')]
+                     for j in range(0, len(key), 4))
+
+    def get(self, ngram, default=0):
+        if self._pending:
+            self.freeze()
+        if not ngram:
+            return self.empty
+        runs = self.runs.get(len(ngram))
+        key = self.key(ngram)
+        if not runs or key is None:
+            return default
+        size = len(key)
+        block = INDEX_EVERY * size
+        count, found = 0, False
+        indexes = self._indexes.get(len(ngram))
+        if indexes is None or len(indexes) < len(runs):
+            indexes = self._run_indexes(len(ngram), runs)
+        for (records, counts), index in zip(runs, indexes):
+            # the record can only be in the last block starting before it
+            start = (bisect_right(index, key) - 1) * block
+            if start < 0:
+                continue
+            end = start + block
+            i = records.find(key, start, end)
+            while i >= 0 and (i - start) % size:
+                # not aligned to a record
+                i = records.find(key, i + 1, end)
+            if i >= 0:
+                count += counts[i // size]
+                found = True
+        return count if found else default
+
+    def successors(self, context):
+        """List of (token, count) pairs for the n-grams that extend a
+        context. They are contiguous in each sorted run, so they are found
+        with two binary searches per run.
+
+        context -- the context tuple.
+        """
+        if self._pending:
+            self.freeze()
+        k = len(context) + 1
+        runs = self.runs.get(k)
+        prefix = self.key(context)
+        if not runs or prefix is None:
+            return []
+        size = 4 * k
+        result = defaultdict(int)  # token id -> count
+        for records, counts in runs:
+            n = len(counts)
+            lo = bisect_records(records, 0, n, size, prefix)
+            hi = bisect_records(records, 0, n, size, prefix, right=True)
+            for i in range(lo, hi):
+                token = records[(i + 1) * size - 4: (i + 1) * size]
+                result[int.from_bytes(token, 'big')] += counts[i]
+        tokens = self.vocab.tokens
+        return [(tokens[i], result[i]) for i in sorted(result)]
+
+    def __getitem__(self, ngram):
+        return self.get(ngram)
+
+    def __contains__(self, ngram):
+        return self.get(ngram, None) is not None
+
+    def __len__(self):
+        self.merge()
+        size = sum(len(runs[0][1]) for runs in self.runs.values() if runs)
+        return size + bool(self.empty)
+
+    def items(self):
+        self.merge()
+        if self.empty:
+            yield (), self.empty
+        for k in sorted(self.runs):
+            size = 4 * k
+            for records, counts in self.runs[k]:
+                for i, c in enumerate(counts):
+                    yield self.ngram(records[i * size: (i + 1) * size]), c
+
+    def __getstate__(self):
+        self.merge()
+        state = dict(self.__dict__)
+        del state['_indexes']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._indexes = {}
+
+    def _add_run(self, k, run):
+        runs = self.runs.setdefault(k, [])
+        runs.append(run)
+        while len(runs) > 1 and len(runs[-2][1]) <= len(runs[-1][1]):
+            runs[-2:] = [merge_runs(runs[-2], runs[-1], 4 * k)]
+        # only the last run changed, its index is built again on demand
+        indexes = self._indexes.get(k)
+        if indexes is not None:
+            del indexes[len(runs) - 1:]
+
+    def _run_indexes(self, k, runs):
+        """Sparse indexes of the runs of an order (the list of the first
+        record of each block of INDEX_EVERY records), built on demand.
+
+        k -- the order.
+        runs -- the runs of the order.
+        """
+        indexes = self._indexes.setdefault(k, [])
+        size = 4 * k
+        block = INDEX_EVERY * size
+        for records, _ in runs[len(indexes):]:
+            # bytes, as they compare faster than bytearrays
+            indexes.append([bytes(records[i: i + size])
+                            for i in range(0, len(records), block)])
+        return indexes
+
+    def _sorted_pending(self):
+        """Take the pending counts, adding the new tokens to the vocabulary.
+        Returns a dict from order to the sorted list of (key, count) pairs of
+        the n-grams of that order, where the key is the integer whose
+        big-endian bytes are the record.
+        """
+        pending = self._pending
+        self._pending = Counter()
+        self.empty += pending.pop((), 0)
+        add = self.vocab.add
+        get = self.vocab.ids.get
+        result = defaultdict(list)
+        for ngram, c in pending.items():
+            key = 0
+            for token in ngram:
+                i = get(token)
+                if i is None:
+                    i = add(token)
+                key = (key << ID_BITS) | i
+            result[len(ngram)].append((key, c))
+        del pending
+        for items in result.values():
+            items.sort()
+        return result
+
+
+class DiskCounts(CompactCounts):
+    """N-gram counts stored in sorted tables on disk.
+
+    Pending counts are spilled to sorted run files whenever max_pending is
+    reached, and the runs of each order are k-way merged into a single
+    table on the first query. A table is a file of fixed-size records, each
+    one being the big-endian 32-bit token ids of an n-gram followed by its
+    count, so the byte order of the records is the order of the n-grams.
+    Tables are memory-mapped and queried with binary search.
+
+    A temporary directory (when no path is given) is removed by cleanup(),
+    when the counts are garbage collected or at exit, so such counts cannot
+    be pickled.
+    """
+
+    # whether the directory is temporary
+    temporary = False
+    _finalizer = None
+
+    def __init__(self, path=None, memory=2 ** 30, vocab=None):
+        """
+        path -- directory where the runs and tables are stored (default: a
+            new temporary directory, see cleanup()).
+        memory -- memory budget in bytes for the pending counts
+            (default: 1GB).
+        vocab -- vocabulary to share with other tables (optional).
+        """
+        max_pending = max(1, memory // PENDING_SIZE)
+        super().__init__(vocab=vocab, max_pending=max_pending)
+        if path is None:
+            path = tempfile.mkdtemp(prefix='ngram-counts-')
+            self.temporary = True
+            self._finalizer = weakref.finalize(
+                self, shutil.rmtree, path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        # absolute, so that pickled counts load from any directory
+        self.path = os.path.abspath(path)
+        self.runs = defaultdict(list)  # order -> list of run files
+        self.merged = True  # whether each order has a single table
+        self._tables = {}  # order -> memory-mapped table
+
+    def freeze(self):
+        """Write the pending counts to new sorted runs."""
+        for k, items in self._sorted_pending().items():
+            filename = os.path.join(
+                self.path, '{}-{}.run'.format(k, len(self.runs[k])))
+            key_size = 4 * k
+            with open(filename, 'wb') as f:
+                for key, c in items:
+                    f.write(key.to_bytes(key_size, 'big'))
+                    f.write(c.to_bytes(4, 'big'))
+            self.runs[k].append(filename)
+            self.merged = False
+
+    def add_runs(self, k, runs):
+        """Write sorted runs of n-grams of an order, with records made with
+        the ids of the vocabulary, to new run files.
+
+        k -- the order.
+        runs -- iterable of (records, counts) runs.
+        """
+        size = 4 * k
+        for records, counts in runs:
+            if not counts:
+                continue
+            filename = os.path.join(
+                self.path, '{}-{}.run'.format(k, len(self.runs[k])))
+            with open(filename, 'wb') as f:
+                for i, c in enumerate(counts):
+                    f.write(records[i * size: (i + 1) * size])
+                    f.write(c.to_bytes(4, 'big'))
+            self.runs[k].append(filename)
+            self.merged = False
+
+    def merge(self):
+        """Merge the runs of each order into a single table."""
+        if self._pending:
+            self.freeze()
+        if self.merged:
+            return
+        for k, runs in self.runs.items():
+            filename = self._table_name(k)
+            if runs == [filename]:
+                continue
+            self._close_table(k)
+            tmp_filename = filename + '.tmp'
+            with open(tmp_filename, 'wb') as f:
+                records = heapq.merge(*[_read_run(run, k) for run in runs])
+                key, c = next(records)
+                c = int.from_bytes(c, 'big')
+                for key2, c2 in records:
+                    if key2 == key:
+                        c += int.from_bytes(c2, 'big')
+                    else:
+                        f.write(key)
+                        f.write(c.to_bytes(4, 'big'))
+                        key, c = key2, int.from_bytes(c2, 'big')
+                f.write(key)
+                f.write(c.to_bytes(4, 'big'))
+            for run in runs:
+                if run != filename:
+                    os.remove(run)
+            os.replace(tmp_filename, filename)
+            self.runs[k] = [filename]
+        self.merged = True
+
+    def get(self, ngram, default=0):
+        if not ngram:
+            return self.empty
+        table = self._table(len(ngram))
+        if table is None:
+            return default
+        key = self.key(ngram)
+        if key is None:
+            return default
+        size = len(key) + 4
+        records = len(table) // size
+        i = bisect_records(table, 0, records, size, key) * size
+        if i < len(table) and table[i: i + size - 4] == key:
+            return int.from_bytes(table[i + size - 4: i + size], 'big')
+        return default
+
+    def successors(self, context):
+        table = self._table(len(context) + 1)
+        prefix = self.key(context)
+        if table is None or prefix is None:
+            return []
+        size = len(prefix) + 8
+        records = len(table) // size
+        lo = bisect_records(table, 0, records, size, prefix)
+        hi = bisect_records(table, 0, records, size, prefix, right=True)
+        tokens = self.vocab.tokens
+        result = []
+        for i in range(lo * size, hi * size, size):
+            token = int.from_bytes(table[i + size - 8: i + size - 4], 'big')
+            c = int.from_bytes(table[i + size - 4: i + size], 'big')
+            result.append((tokens[token], c))
+        return result
+
+    def __len__(self):
+        self.merge()
+        size = sum(os.path.getsize(runs[0]) // (4 * (k + 1))
+                   for k, runs in self.runs.items())
+        return size + bool(self.empty)
+
+    def items(self):
+        self.merge()
+        if self.empty:
+            yield (), self.empty
+        for k in sorted(self.runs):
+            for key, c in _read_run(self.runs[k][0], k):
+                yield self.ngram(key), int.from_bytes(c, 'big')
+
+    def close(self):
+        """Close the memory-mapped tables."""
+        for k in list(self._tables):
+            self._close_table(k)
+
+    def cleanup(self):
+        """Close the tables and, if the directory is temporary, remove it.
+        The counts are unusable after that.
+        """
+        self.close()
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __getstate__(self):
+        if self.temporary:
+            raise TypeError('counts in a temporary directory cannot be '
+                            'pickled: give a path')
+        self.merge()
+        state = dict(self.__dict__)
+        state['_tables'] = {}
+        del state['_indexes']
+        return state
+
+    def _table_name(self, k):
+        return os.path.join(self.path, '{}.counts'.format(k))
+
+    def _table(self, k):
+        if self._pending or not self.merged:
+            self.merge()
+        table = self._tables.get(k)
+        if table is None and self.runs.get(k):
+            with open(self.runs[k][0], 'rb') as f:
+                table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._tables[k] = table
+        return table
+
+    def _close_table(self, k):
+        table = self._tables.pop(k, None)
+        if table is not None:
+            table.close()
+
+
+@lru_cache(maxsize=None)
+def key_struct(k):
+    """Struct of the records of the n-grams of an order.
+
+    k -- the order.
+    """
+    return struct.Struct('>{}I'.format(k))
+
+
+def bisect_records(data, offset, records, size, key, right=False):
+    """Index of the first record of a sorted table whose key prefix is not
+    less than a key (or greater than it if right is True).
+
+    data -- the table data (bytes or mmap).
+    offset -- offset of the first record.
+    records -- number of records.
+    size -- size of the records.
+    key -- the key, compared with the first len(key) bytes of the records.
+    right -- whether to skip the records equal to the key (default: False).
+    """
+    key_size = len(key)
+    lo, hi = 0, records
+    while lo < hi:
+        mid = (lo + hi) // 2
+        i = offset + mid * size
+        record_key = data[i: i + key_size]
+        if record_key < key or (right and record_key == key):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _read_run(filename, k, block=2 ** 12):
+    """Iterate over the (key bytes, count bytes) records of a run file.
+
+    filename -- the run file.
+    k -- order of the n-grams in the file.
+    block -- number of records read at a time (default: 2 ** 12).
+    """
+    key_size = 4 * k
+    size = key_size + 4
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(size * block)
+            if not data:
+                break
+            for i in range(0, len(data), size):
+                yield data[i: i + key_size], data[i + key_size: i + size]
+
+
+def make_run(items, k):
+    """Run of records and counts of a sorted list of (key, count) pairs of
+    n-grams, where the key is the integer whose big-endian bytes are the
+    record.
+
+    items -- the (key, count) pairs.
+    k -- order of the n-grams.
+    """
+    size = 4 * k
+    records = b''.join([key.to_bytes(size, 'big') for key, _ in items])
+    return records, array('I', [c for _, c in items])
+
+
+def merge_runs(run1, run2, size):
+    """Merge two sorted runs of records and counts into a new run, adding the
+    counts of repeated records. The records of the smaller run are placed in
+    the larger one with exponential search, and the stretches of the larger
+    run in between are copied in bulk, so merging a small run into a large
+    one is cheap. The output arrays are preallocated and truncated at the
+    end.
+
+    run1, run2 -- the (records, counts) runs.
+    size -- size of the records.
+    """
+    if len(run1[1]) < len(run2[1]):
+        run1, run2 = run2, run1
+    records1, counts1 = run1
+    records2, counts2 = run2
+    n1, n2 = len(counts1), len(counts2)
+    records = bytearray(len(records1) + len(records2))
+    counts = array('I', bytes(4 * (n1 + n2)))
+    i = m = 0  # next record of run1 and of the output
+    for j in range(n2):
+        record = records2[j * size: (j + 1) * size]
+        # find the first record of run1 not less than this one
+        lo, hi, step = i, i, 1
+        while hi < n1 and records1[hi * size: (hi + 1) * size] < record:
+            lo = hi + 1
+            hi = lo + step
+            step *= 2
+        hi = min(hi, n1)
+        p = lo + bisect_records(records1, lo * size, hi - lo, size, record)
+        if p > i:
+            records[m * size: (m + p - i) * size] = \
+                records1[i * size: p * size]
+            counts[m: m + p - i] = counts1[i: p]
+            m += p - i
+            i = p
+        c = counts2[j]
+        if i < n1 and records1[i * size: (i + 1) * size] == record:
+            c += counts1[i]
+            i += 1
+        records[m * size: (m + 1) * size] = record
+        counts[m] = c
+        m += 1
+    if i < n1:
+        records[m * size: (m + n1 - i) * size] = records1[i * size:]
+        counts[m: m + n1 - i] = counts1[i:]
+        m += n1 - i
+    del records[m * size:]
+    del counts[m:]
+    return records, counts
@@ -1,29 +1,426 @@
 # https://docs.python.org/3/library/collections.html
-from collections import defaultdict
+from collections import Counter, defaultdict
+from functools import partial
+from itertools import chain, islice
+from math import log2
+from multiprocessing import Pool
+import os
+import pickle
+import tempfile
+import zlib
+
+from languagemodeling.cache import LRUCache
+from languagemodeling.counts import CompactCounts, DiskCounts, Vocabulary
 
 
 class NGram(object):
 
-    def __init__(self, n, sents):
+    # LRU cache for cond_prob(), or None
+    cache = None
+    # index of the successors of each context (built on demand), or None
+    _successors = None
+
+    def __init__(self, n, sents, compact=False, workers=1, memory=None,
+                 path=None, cache_size=None):
         """
         n -- order of the model.
-        sents -- list of sentences, each one being a list of tokens.
+        sents -- iterable of sentences, each one being a list of tokens. It
+            is consumed in a single pass, so it may be a generator.
+        compact -- store the counts in integer-encoded sorted arrays instead
+            of a dict of tuples. They take less memory, but lookups are
+            several times slower, so a dict is better for scoring if the
+            counts fit in memory (default: False).
+        workers -- number of processes used for counting (default: 1).
+        memory -- memory budget in bytes for counting. If given, the counts
+            are spilled to disk when the budget is reached and the final
+            count tables are kept on disk. The budget is not kept when
+            counting in many processes, so workers must be 1 (default:
+            None).
+        path -- directory for the count tables on disk. It must be kept as
+            long as the model is used, also by pickled models (default: a new
+            temporary directory, removed when the counts are garbage
+            collected or at exit, so the model cannot be pickled).
+        cache_size -- size of an LRU cache for cond_prob() (default: None,
+            no cache).
         """
         assert n > 0
+        if memory is not None and workers > 1:
+            raise ValueError('counting on disk needs workers=1')
         self.n = n
-        self.counts = counts = defaultdict(int)
+        self.set_cache(cache_size)
+        if memory is not None:
+            self.counts = DiskCounts(path, memory)
+        elif compact:
+            self.counts = CompactCounts()
+        else:
+            self.counts = defaultdict(int)
+        self.update(sents, workers)
 
-        for sent in sents:
-            for i in range(len(sent) - n + 1):
-                ngram = tuple(sent[i: i + n])
+    def update(self, sents, workers=1, chunk_size=10000):
+        """Add the counts of more sentences to the model, without retraining
+        from scratch.
+
+        sents -- iterable of sentences, each one being a list of tokens. It
+            is consumed in a single pass, so it may be a generator.
+        workers -- number of processes used for counting. It must be 1 if
+            the counts are on disk (default: 1).
+        chunk_size -- number of sentences counted by each process at a time
+            when workers > 1 (default: 10000).
+        """
+        if workers > 1 and isinstance(self.counts, DiskCounts):
+            raise ValueError('counting on disk needs workers=1')
+        if self.cache is not None:
+            self.cache.clear()
+        self._successors = None
+        if workers > 1:
+            self._parallel_update(sents, workers, chunk_size)
+            return
+
+        counts = self.counts
+        if isinstance(counts, CompactCounts):
+            counts.update(self.ngrams(sents))
+        else:
+            for ngram in self.ngrams(sents):
                 counts[ngram] += 1
-                counts[ngram[:-1]] += 1
 
-    def prob(self, token, prev_tokens=None):
+    def _parallel_update(self, sents, workers, chunk_size):
+        """Count in a process pool, partitioning the n-grams by a hash of
+        their first token so each process owns a disjoint set of them.
+
+        In the first phase, the processes count chunks of sentences and
+        write the counts of each chunk split by owner to shard files. In the
+        second phase, each process adds up the shards it owns. With compact
+        counts, each process adds them to a compact table frozen every
+        max_pending n-grams, as in a serial update, and writes its sorted
+        runs to a file. The new tokens get ids grouped by owner, so the runs
+        of the owners are disjoint key ranges, and they are appended to the
+        table one process at a time.
+        """
+        n = self.n
+        counts = self.counts
+        compact = isinstance(counts, CompactCounts)
+        fresh = not compact and not counts
+        sents = iter(sents)
+        with tempfile.TemporaryDirectory(prefix='ngram-shards-') as path, \
+                Pool(workers) as pool:
+            # count the chunks, only one chunk per process at a time
+            count = partial(count_shards, n, workers, path)
+            tokens = set()
+            n_chunks = 0
+            while True:
+                chunks = [list(islice(sents, chunk_size))
+                          for _ in range(workers)]
+                chunks = [(n_chunks + i, chunk)
+                          for i, chunk in enumerate(chunks) if chunk]
+                if not chunks:
+                    break
+                for chunk_tokens in pool.map(count, chunks):
+                    tokens.update(chunk_tokens)
+                n_chunks += len(chunks)
+
+            if compact:
+                vocab = counts.vocab
+                new_tokens = [t for t in tokens if t not in vocab]
+                new_tokens.sort(key=lambda t: (owner(t, workers), t))
+                for token in new_tokens:
+                    vocab.add(token)
+                del tokens, new_tokens
+
+                # add up the shards of each owner and append the runs to the
+                # table in owner order
+                reduce = partial(reduce_compact_shards, path, n_chunks,
+                                 vocab.tokens, counts.max_pending)
+                pool.map(reduce, range(workers))
+                for w in range(workers):
+                    filename = os.path.join(path, 'runs-{}.pickle'.format(w))
+                    with open(filename, 'rb') as f:
+                        empty, runs = pickle.load(f)
+                    os.remove(filename)
+                    counts.empty += empty
+                    for k in sorted(runs):
+                        counts.add_runs(k, [runs.pop(k)])
+                    del runs
+                return
+
+            # add up the shards of each owner
+            reduce = partial(reduce_shards, path, n_chunks)
+            for shard in pool.imap(reduce, range(workers)):
+                if fresh:
+                    # disjoint shards
+                    counts.update(shard)
+                else:
+                    for ngram, c in shard.items():
+                        counts[ngram] += c
+                del shard
+
+    def ngrams(self, sents):
+        """Iterate over the n-grams and (n-1)-grams to be counted.
+
+        sents -- iterable of sentences, each one being a list of tokens.
+        """
+        return ngrams(self.n, sents)
+
+    def count(self, tokens):
+        """Count for an n-gram or (n-1)-gram.
+
+        tokens -- the n-gram or (n-1)-gram tuple.
+        """
+        return self.counts.get(tuple(tokens), 0)
+
+    def successors(self, prev_tokens):
+        """List of (token, count) pairs for the tokens seen after a context of
+        n-1 tokens.
+
+        prev_tokens -- the context.
+        """
+        counts = self.counts
+        if isinstance(counts, CompactCounts):
+            return counts.successors(tuple(prev_tokens))
+
+        # index the successors of every context on the first call
+        if self._successors is None:
+            n = self.n
+            index = defaultdict(list)
+            for ngram, c in counts.items():
+                if len(ngram) == n and c:
+                    index[ngram[:-1]].append((ngram[-1], c))
+            self._successors = dict(index)
+        return list(self._successors.get(tuple(prev_tokens), []))
+
+    def set_cache(self, size):
+        """Memoize cond_prob() in an LRU cache. The cache keeps hit and miss
+        counters and is safe to use from many threads.
+
+        size -- maximum number of cached probabilities (None or 0 to disable
+            the cache).
+        """
+        self.cache = LRUCache(size) if size else None
+
+    def cond_prob(self, token, prev_tokens=None):
+        """Conditional probability of a token.
+
+        token -- the token.
+        prev_tokens -- the previous n-1 tokens (optional only if n = 1).
+        """
+        cache = self.cache
+        if cache is None:
+            return self._cond_prob(token, prev_tokens)
+        key = (token, tuple(prev_tokens or ()))
+        p = cache.get(key)
+        if p is None:
+            p = self._cond_prob(token, prev_tokens)
+            cache.put(key, p)
+        return p
+
+    prob = cond_prob
+
+    def _cond_prob(self, token, prev_tokens=None):
+        """Conditional probability of a token, without using the cache.
+
+        token -- the token.
+        prev_tokens -- the previous n-1 tokens (optional only if n = 1).
+        """
         n = self.n
         if not prev_tokens:
             prev_tokens = []
         assert len(prev_tokens) == n - 1
 
-        tokens = prev_tokens + [token]
-        return float(self.counts[tuple(tokens)]) / self.counts[tuple(prev_tokens)]
+        tokens = list(prev_tokens) + [token]
+        denom = self.count(prev_tokens)
+        if denom == 0:
+            return 0.0
+        return float(self.count(tokens)) / denom
+
+    def sent_prob(self, sent):
+        """Probability of a sentence. Warning: subject to underflow problems.
+
+        sent -- the sentence as a list of tokens.
+        """
+        n = self.n
+        sent = ['<s>'] * (n - 1) + list(sent) + ['</s>']
+        prob = 1.0
+        for i in range(n - 1, len(sent)):
+            prob *= self.cond_prob(sent[i], sent[i - n + 1: i])
+            if prob == 0.0:
+                break
+        return prob
+
+    def sent_log_prob(self, sent):
+        """Log-probability of a sentence.
+
+        sent -- the sentence as a list of tokens.
+        """
+        n = self.n
+        sent = ['<s>'] * (n - 1) + list(sent) + ['</s>']
+        log_prob = 0.0
+        for i in range(n - 1, len(sent)):
+            p = self.cond_prob(sent[i], sent[i - n + 1: i])
+            if p == 0.0:
+                return float('-inf')
+            log_prob += log2(p)
+        return log_prob
+
+    def start_state(self):
+        """Scoring state at the beginning of a sentence. States are opaque
+        values to be passed to score().
+        """
+        return ('<s>',) * (self.n - 1)
+
+    def score(self, state, token):
+        """Incremental scoring: log-probability of a token after a state, and
+        the state after the token. Scoring every token of a sentence and then
+        '</s>', starting from start_state(), gives sent_log_prob().
+
+        state -- the state before the token.
+        token -- the token.
+        """
+        p = self.cond_prob(token, list(state))
+        log_prob = log2(p) if p > 0.0 else float('-inf')
+        if state:
+            state = state[1:] + (token,)
+        return log_prob, state
+
+    def batch_log_prob(self, sents):
+        """Log-probabilities of many sentences. Each distinct n-gram in the
+        batch is scored only once, so this is much faster than calling
+        sent_log_prob() for sentences that share most of their n-grams (as
+        the candidates of a reranker do).
+
+        sents -- iterable of sentences, each one being a list of tokens.
+        """
+        n = self.n
+        cond_prob = self.cond_prob
+        log_probs = {}  # n-gram -> conditional log-probability
+        result = []
+        for sent in sents:
+            sent = ('<s>',) * (n - 1) + tuple(sent) + ('</s>',)
+            log_prob = 0.0
+            for i in range(len(sent) - n + 1):
+                ngram = sent[i: i + n]
+                lp = log_probs.get(ngram)
+                if lp is None:
+                    p = cond_prob(ngram[-1], list(ngram[:-1]))
+                    lp = log2(p) if p > 0.0 else float('-inf')
+                    log_probs[ngram] = lp
+                log_prob += lp
+            result.append(log_prob)
+        return result
+
+
+def ngrams(n, sents):
+    """Iterate over the n-grams and (n-1)-grams of some sentences, padded with
+    '<s>' and '</s>'.
+
+    n -- order of the n-grams.
+    sents -- iterable of sentences, each one being a list of tokens.
+    """
+    for sent in sents:
+        sent = ['<s>'] * (n - 1) + list(sent) + ['</s>']
+        for i in range(len(sent) - n + 1):
+            ngram = tuple(sent[i: i + n])
+            yield ngram
+            yield ngram[:-1]
+
+
+def owner(token, workers):
+    """Number of the process that counts the n-grams starting with a token
+    (the same in every process, unlike hash()).
+
+    token -- the token.
+    workers -- number of processes.
+    """
+    return zlib.crc32(token.encode('utf-8')) % workers
+
+
+def count_shards(n, workers, path, chunk):
+    """Count the n-grams and (n-1)-grams of a chunk of sentences and write
+    the counts owned by each process to a shard file. Returns the set of
+    tokens of the chunk.
+
+    n -- order of the n-grams.
+    workers -- number of processes.
+    path -- directory of the shard files.
+    chunk -- pair of the chunk number and the list of sentences.
+    """
+    i, sents = chunk
+    counts = Counter()
+    counts.update(ngrams(n, sents))
+    owners = {}
+    shards = [{} for _ in range(workers)]
+    for ngram, c in counts.items():
+        # the empty n-gram goes to the first process
+        first = ngram[0] if ngram else None
+        w = owners.get(first)
+        if w is None:
+            w = owners[first] = owner(first, workers) if ngram else 0
+        shards[w][ngram] = c
+    del counts
+    for w, shard in enumerate(shards):
+        filename = os.path.join(path, '{}-{}.pickle'.format(i, w))
+        with open(filename, 'wb') as f:
+            pickle.dump(shard, f, pickle.HIGHEST_PROTOCOL)
+    tokens = set(chain.from_iterable(sents))
+    tokens.add('</s>')
+    if n > 1:
+        tokens.add('<s>')
+    return tokens
+
+
+def read_shards(path, n_chunks, w):
+    """Iterate over the shards of the chunks owned by a process, removing
+    their files.
+
+    path -- directory of the shard files.
+    n_chunks -- number of chunks.
+    w -- number of the process.
+    """
+    for i in range(n_chunks):
+        filename = os.path.join(path, '{}-{}.pickle'.format(i, w))
+        with open(filename, 'rb') as f:
+            shard = pickle.load(f)
+        os.remove(filename)
+        yield shard
+
+
+def reduce_shards(path, n_chunks, w):
+    """Add up the shards of the chunks owned by a process. Returns the dict
+    of counts.
+
+    path -- directory of the shard files.
+    n_chunks -- number of chunks.
+    w -- number of the process.
+    """
+    counts = {}
+    for shard in read_shards(path, n_chunks, w):
+        if not counts:
+            counts = shard
+            continue
+        get = counts.get
+        for ngram, c in shard.items():
+            counts[ngram] = get(ngram, 0) + c
+    return counts
+
+
+def reduce_compact_shards(path, n_chunks, tokens, max_pending, w):
+    """Add up the shards of the chunks owned by a process in a compact
+    table, frozen every max_pending n-grams, and write the count of the
+    empty n-gram and the single sorted run of each order to the file
+    'runs-<w>.pickle'.
+
+    path -- directory of the shard files.
+    n_chunks -- number of chunks.
+    tokens -- list of the tokens of the vocabulary, in id order, with all the
+        tokens of the shards.
+    max_pending -- number of distinct pending n-grams that triggers a
+        freeze().
+    w -- number of the process.
+    """
+    table = CompactCounts(vocab=Vocabulary(tokens), max_pending=max_pending)
+    for shard in read_shards(path, n_chunks, w):
+        table.add_counts(shard)
+        del shard
+    table.merge()
+    runs = {k: k_runs[0] for k, k_runs in table.runs.items()}
+    filename = os.path.join(path, 'runs-{}.pickle'.format(w))
+    with open(filename, 'wb') as f:
+        pickle.dump((table.empty, runs), f, pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,135 @@
+"""Evaulate a language model using the test set.
+
+By default the model is evaluated on Jane Austen's Persuasion from the
+Gutenberg corpus. With -t, it is evaluated on tokenized text files with one
+sentence per line, read in a single pass.
+
+Usage:
+  eval.py -i <file> [-t <file>...] [-w <w>]
+  eval.py -h | --help
+
+Options:
+  -i <file>     Language model file (pickled or in the binary format).
+  -t <file>     Tokenized test file with one sentence per line. May be given
+                many times.
+  -w <w>        Number of processes used for scoring [default: 1].
+  -h --help     Show this screen.
+"""
+from docopt import docopt
+from itertools import chain, islice
+from multiprocessing import Pool
+import os
+import pickle
+import sys
+import time
+
+from nltk.corpus import gutenberg
+
+from corpus.text import line_sents
+from languagemodeling import binary
+
+
+# the model used by the scoring processes
+model = None
+
+# number of sentences scored at a time by each process
+CHUNK_SIZE = 1000
+
+
+def progress(msg, width=None):
+    """Ouput the progress of something on the same line."""
+    if not width:
+        width = len(msg)
+    print('\b' * width + msg, end='')
+    sys.stdout.flush()
+
+
+def load_model(filename):
+    """Load a language model, either in the binary format or pickled."""
+    try:
+        return binary.load(filename)
+    except ValueError:
+        f = open(filename, 'rb')
+        m = pickle.load(f)
+        f.close()
+        return m
+
+
+def init_worker(filename):
+    """Load the model in a scoring process, unless it was inherited from the
+    parent process (it is when processes are forked).
+    """
+    global model
+    if model is None:
+        model = load_model(filename)
+
+
+def score(sents):
+    """Log-probability and number of tokens (including the end markers) of a
+    list of sentences.
+    """
+    log_prob = sum(model.batch_log_prob(sents))
+    tokens = sum(len(sent) + 1 for sent in sents)
+    return log_prob, tokens
+
+
+def chunks(sents, size):
+    """Split an iterable of sentences in lists of at most size sentences."""
+    sents = iter(sents)
+    chunk = list(islice(sents, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(sents, size))
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+
+    # load the model
+    filename = opts['-i']
+    model = load_model(filename)
+
+    # load the data
+    if opts['-t']:
+        sents = chain.from_iterable(line_sents(f) for f in opts['-t'])
+    else:
+        sents = gutenberg.sents('austen-persuasion.txt')
+
+    # score
+    workers = int(opts['-w'])
+    pool = Pool(workers, init_worker, (filename,)) if workers > 1 else None
+    sent_chunks = chunks(sents, CHUNK_SIZE)
+    log_prob, total = 0.0, 0
+    start = time.time()
+    while True:
+        # read only one chunk per process at a time
+        batch = list(islice(sent_chunks, workers))
+        if not batch:
+            break
+        if pool is not None:
+            results = pool.map(score, batch)
+        else:
+            results = map(score, batch)
+        for lp, tokens in results:
+            log_prob += lp
+            total += tokens
+        elapsed = max(time.time() - start, 1e-6)
+        progress('{} tokens ({:.0f} tokens/s)'.format(total, total / elapsed))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    elapsed = max(time.time() - start, 1e-6)
+
+    if total == 0:
+        print('Nothing to score: the test set is empty.')
+        sys.exit(1)
+
+    cross_entropy = -log_prob / total
+    perplexity = 2 ** cross_entropy
+
+    print('')
+    print('Log-likelihood: {}'.format(log_prob))
+    print('Cross-entropy: {}'.format(cross_entropy))
+    print('Perplexity: {}'.format(perplexity))
+    print('Tokens: {} ({:.0f} tokens/s)'.format(total, total / elapsed))
+    print('Model size: {} bytes'.format(os.path.getsize(filename)))
@@ -1,34 +1,89 @@
 """Train an n-gram model.
 
+By default the model is trained on Jane Austen's Emma from the Gutenberg
+corpus. With -i, it is trained on a tokenized text file with one sentence per
+line, streamed in a single pass so that only the counts are kept in memory.
+
 Usage:
-  train.py -n <n> -o <file>
+  train.py -n <n> [-i <file>...] [--compact] [-w <w>]
+           [(-m <bytes> -d <dir>)] [--binary [-q <bits>]] -o <file>
   train.py -h | --help
 
 Options:
   -n <n>        Order of the model.
+  -i <file>     Tokenized text file with one sentence per line. May be given
+                many times.
+  --compact     Store the counts in compact integer arrays (less memory, but
+                slower to query).
+  -w <w>        Number of processes used for counting [default: 1].
+  -m <bytes>    Memory budget for counting. Counts are spilled to disk when
+                it is reached and the final count tables are kept on disk.
+                Not available with many processes (-w).
+  -d <dir>      Directory for the count tables on disk (required with -m).
+                A pickled model reads its counts from there, so it must be
+                kept along with the model file.
+  --binary      Save the model in the binary memory-mapped format instead
+                of pickling it.
+  -q <bits>     Quantize the probabilities of the binary model to 8 or 16
+                bits [default: 0].
   -o <file>     Output model file.
   -h --help     Show this screen.
 """
 from docopt import docopt
 import pickle
+import sys
 
 from nltk.corpus import gutenberg
 
+from corpus.text import line_sents
 from languagemodeling.ngram import NGram
+from languagemodeling import binary
+
+
+def progress(msg, width=None):
+    """Ouput the progress of something on the same line."""
+    if not width:
+        width = len(msg)
+    print('\b' * width + msg, end='')
+    sys.stdout.flush()
+
+
+def with_progress(sents, every=10000):
+    """Iterate over the sentences reporting how many have been read."""
+    i = 0
+    for i, sent in enumerate(sents, 1):
+        if i % every == 0:
+            progress('{} sents'.format(i))
+        yield sent
+    progress('{} sents'.format(i))
+    print('')
 
 
 if __name__ == '__main__':
     opts = docopt(__doc__)
 
-    # load the data
-    sents = gutenberg.sents('austen-emma.txt')
-
     # train the model
     n = int(opts['-n'])
-    model = NGram(n, sents)
+    workers = int(opts['-w'])
+    memory = opts['-m'] and int(opts['-m'])
+    if memory is not None and workers > 1:
+        # the processes do not keep the memory budget
+        sys.exit('-m cannot be used with -w greater than 1')
+    model = NGram(n, [], compact=opts['--compact'], memory=memory,
+                  path=opts['-d'])
+    if opts['-i']:
+        for filename in opts['-i']:
+            print('Training on {}...'.format(filename))
+            model.update(with_progress(line_sents(filename)), workers)
+    else:
+        sents = gutenberg.sents('austen-emma.txt')
+        model.update(with_progress(sents), workers)
 
     # save it
     filename = opts['-o']
-    f = open(filename, 'wb')
-    pickle.dump(model, f)
-    f.close()
+    if opts['--binary']:
+        binary.save(model, filename, int(opts['-q']))
+    else:
+        f = open(filename, 'wb')
+        pickle.dump(model, f)
+        f.close()
@@ -0,0 +1,152 @@
+# https://docs.python.org/3/library/unittest.html
+from unittest import TestCase
+from math import log2
+import os
+import pickle
+import tempfile
+
+from languagemodeling import binary
+from languagemodeling.ngram import NGram
+from languagemodeling.binary import save, load, quantize
+
+
+class TestBinary(TestCase):
+
+    def setUp(self):
+        self.sents = [
+            'el gato come pescado .'.split(),
+            'la gata come salmón .'.split(),
+        ]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'model.bin')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_load(self):
+        sents = self.sents + [
+            'el gato come salame .'.split(),
+            'la la la'.split(),
+        ]
+        for n in [1, 2, 3]:
+            for compact in [False, True]:
+                ngram = NGram(n, self.sents, compact=compact)
+                save(ngram, self.filename)
+                model = load(self.filename)
+
+                self.assertEqual(model.n, n)
+                for gram, c in ngram.counts.items():
+                    self.assertEqual(model.count(gram), c, gram)
+                self.assertEqual(model.count(('salame',)), 0)
+                for sent in sents:
+                    self.assertEqual(model.sent_log_prob(sent),
+                                     ngram.sent_log_prob(sent))
+                model.close()
+
+    def test_save_runs(self):
+        sents = self.sents + ['el gato come salmón .'.split()]
+        path = os.path.join(self.tmpdir.name, 'counts')
+        for kwargs in [{}, {'compact': True}, {'memory': 2 ** 20}]:
+            ngram = NGram(3, sents, path=path, **kwargs)
+            for bits in [0, 8]:
+                save(ngram, self.filename, bits)
+                with open(self.filename, 'rb') as f:
+                    data = f.read()
+
+                # records sorted in many runs and merged
+                run_size = binary.RUN_SIZE
+                binary.RUN_SIZE = 2
+                try:
+                    save(ngram, self.filename, bits)
+                finally:
+                    binary.RUN_SIZE = run_size
+                with open(self.filename, 'rb') as f:
+                    self.assertEqual(f.read(), data, (kwargs, bits))
+
+                model = load(self.filename)
+                for gram, c in ngram.counts.items():
+                    self.assertEqual(model.count(gram), c, gram)
+                model.close()
+
+    def test_vocabulary(self):
+        ngram = NGram(2, self.sents)
+        save(ngram, self.filename)
+        model = load(self.filename)
+
+        tokens = [model.token(i) for i in range(model.vocab_size)]
+        self.assertEqual(set(tokens), {'<s>', '</s>', 'el', 'gato', 'come',
+                                       'pescado', '.', 'la', 'gata',
+                                       'salmón'})
+        for i, token in enumerate(tokens):
+            self.assertEqual(model.token_id(token), i)
+        self.assertEqual(model.token_id('salame'), None)
+        model.close()
+
+    def test_pickle(self):
+        ngram = NGram(2, self.sents)
+        save(ngram, self.filename)
+        model = load(self.filename)
+        model2 = pickle.loads(pickle.dumps(model))
+
+        self.assertEqual(model2.cond_prob('pescado', ['come']), 0.5)
+        model.close()
+        model2.close()
+
+    def test_bad_file(self):
+        with open(self.filename, 'wb') as f:
+            pickle.dump(NGram(1, self.sents), f)
+
+        self.assertRaises(ValueError, load, self.filename)
+
+    def test_read_only(self):
+        save(NGram(2, self.sents), self.filename)
+        model = load(self.filename)
+
+        self.assertRaises(TypeError, model.update, self.sents)
+        model.close()
+
+    def test_quantize(self):
+        probs = [0.5, 0.25, 0.5, 1.0]
+
+        # few distinct probabilities: exact
+        codebook, codes = quantize(probs, 8)
+        self.assertEqual([codebook[c] for c in codes], probs)
+
+        # 2 bins in the log domain: [-2, -1) and [-1, 0]
+        probs = [0.25, 0.3, 1.0, 0.9]
+        codebook, codes = quantize(probs, 1)
+        self.assertEqual(codes, [0, 0, 1, 1])
+        mean = (log2(0.25) + log2(0.3)) / 2
+        self.assertAlmostEqual(codebook[0], 2 ** mean)
+        self.assertAlmostEqual(codebook[1], 2 ** (log2(0.9) / 2))
+
+    def test_quantized(self):
+        sents = self.sents + ['el gato come salmón .'.split()]
+        ngram = NGram(3, sents)
+        save(ngram, self.filename)
+        size = os.path.getsize(self.filename)
+
+        for bits in [8, 16]:
+            filename = self.filename + str(bits)
+            save(ngram, filename, bits)
+            model = load(filename)
+
+            self.assertTrue(os.path.getsize(filename) < size)
+            for gram, c in ngram.counts.items():
+                self.assertEqual(model.count(gram), c, gram)
+            for sent in sents:
+                self.assertAlmostEqual(model.sent_log_prob(sent),
+                                       ngram.sent_log_prob(sent), places=1)
+            self.assertEqual(model.cond_prob('salame', ['el', 'gato']), 0.0)
+            model.close()
+
+    def test_successors(self):
+        ngram = NGram(2, self.sents)
+        for bits in [0, 8]:
+            save(ngram, self.filename, bits)
+            model = load(self.filename)
+
+            for prev in [('<s>',), ('come',), ('.',), ('salame',)]:
+                self.assertEqual(set(model.successors(prev)),
+                                 set(ngram.successors(prev)))
+            model.close()
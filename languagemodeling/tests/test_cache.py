@@ -0,0 +1,88 @@
+# https://docs.python.org/3/library/unittest.html
+from unittest import TestCase
+import pickle
+import threading
+
+from languagemodeling.cache import LRUCache
+from languagemodeling.ngram import NGram
+
+
+class TestLRUCache(TestCase):
+
+    def setUp(self):
+        self.sents = [
+            'el gato come pescado .'.split(),
+            'la gata come salmón .'.split(),
+        ]
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # 'a' is now the most recent
+        cache.put('c', 3)  # evicts 'b'
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+        self.assertEqual(cache.hit_rate(), 0.75)
+
+    def test_ngram_cache(self):
+        ngram = NGram(2, self.sents)
+        cached = NGram(2, self.sents, cache_size=3)
+
+        for i in range(3):
+            for token, prev in [('pescado', 'come'), ('salame', 'come'),
+                                ('gato', 'el'), ('.', 'pescado')]:
+                self.assertEqual(cached.cond_prob(token, [prev]),
+                                 ngram.cond_prob(token, [prev]))
+        self.assertEqual(len(cached.cache), 3)
+        self.assertEqual(cached.cache.misses, 12)  # 4 contexts, size 3
+
+        # the 6 bigrams of the sentence fit in the cache
+        cached.set_cache(10)
+        sent = 'el gato come pescado .'.split()
+        cached.sent_log_prob(sent)
+        cached.sent_log_prob(sent)
+        self.assertEqual((cached.cache.hits, cached.cache.misses), (6, 6))
+
+        # the cache is cleared when the counts change
+        cached.update(self.sents)
+        self.assertEqual(len(cached.cache), 0)
+
+    def test_threads(self):
+        ngram = NGram(2, self.sents)
+        cached = NGram(2, self.sents, cache_size=5)
+        sents = [s.split() for s in [
+            'el gato come pescado .',
+            'la gata come salmón .',
+            'el gato come salmón .',
+        ]]
+        log_probs = [ngram.sent_log_prob(sent) for sent in sents]
+        errors = []
+
+        def score():
+            for i in range(100):
+                for sent, lp in zip(sents, log_probs):
+                    if cached.sent_log_prob(sent) != lp:
+                        errors.append(sent)
+
+        threads = [threading.Thread(target=score) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(cached.cache.hits + cached.cache.misses, 7200)
+
+    def test_pickle(self):
+        cached = NGram(2, self.sents, cache_size=3)
+        cached.cond_prob('pescado', ['come'])
+        cached2 = pickle.loads(pickle.dumps(cached))
+
+        self.assertEqual(cached2.cache.size, 3)
+        self.assertEqual(len(cached2.cache), 0)
+        self.assertEqual(cached2.cond_prob('pescado', ['come']), 0.5)
@@ -0,0 +1,275 @@
+# https://docs.python.org/3/library/unittest.html
+from unittest import TestCase
+import os
+import pickle
+import tempfile
+
+from languagemodeling import counts as counts_module
+from languagemodeling.counts import Vocabulary, CompactCounts, DiskCounts
+from languagemodeling.ngram import NGram
+
+
+class TestCompactCounts(TestCase):
+
+    def setUp(self):
+        self.sents = [
+            'el gato come pescado .'.split(),
+            'la gata come salmón .'.split(),
+        ]
+
+    def test_vocabulary(self):
+        vocab = Vocabulary('el gato come el'.split())
+
+        self.assertEqual(len(vocab), 3)
+        self.assertEqual(vocab.get('el'), 0)
+        self.assertEqual(vocab.get('come'), 2)
+        self.assertEqual(vocab.get('salame'), None)
+        self.assertEqual(vocab.add('salame'), 3)
+
+    def test_counts(self):
+        counts = {
+            (): 12,
+            ('el',): 1,
+            ('come',): 2,
+            ('el', 'gato'): 1,
+            ('.', '</s>'): 2,
+        }
+        compact = CompactCounts(counts)
+
+        for gram, c in counts.items():
+            self.assertEqual(compact[gram], c, gram)
+        self.assertEqual(compact[('salame',)], 0)
+        self.assertEqual(compact[('gato', 'el')], 0)
+        self.assertEqual(dict(compact.items()), counts)
+
+    def test_add_after_freeze(self):
+        compact = CompactCounts()
+        compact.update([('el', 'gato'), ('el', 'gato')])
+        self.assertEqual(compact[('el', 'gato')], 2)
+
+        # new tokens make the vocabulary grow and the keys get repacked
+        compact.update([('la', 'gata'), ('come', 'pescado'), ('el', 'gato')])
+        self.assertEqual(compact[('el', 'gato')], 3)
+        self.assertEqual(compact[('la', 'gata')], 1)
+        self.assertEqual(compact[('come', 'pescado')], 1)
+
+    def test_update_bounded(self):
+        ngrams = [('el', 'gato'), ('la', 'gata'), ('el', 'gato'), ('el',)]
+        check_every = counts_module.CHECK_EVERY
+        counts_module.CHECK_EVERY = 1
+        try:
+            compact = CompactCounts(max_pending=1)
+            compact.update(ngrams)
+        finally:
+            counts_module.CHECK_EVERY = check_every
+
+        self.assertEqual(compact.pending_size(), 0)
+        self.assertEqual(compact[('el', 'gato')], 2)
+        self.assertEqual(compact[('la', 'gata')], 1)
+        self.assertEqual(compact[('el',)], 1)
+
+    def test_runs(self):
+        compact = CompactCounts()
+        compact.update(('w{}'.format(i),) for i in range(1000))
+        big = compact.runs[1][0]
+
+        # small updates add small runs and never rebuild the big one
+        for i in range(10):
+            compact.update([('x{}'.format(i),)])
+        runs = compact.runs[1]
+        self.assertIs(runs[0], big)
+        self.assertEqual([len(counts) for _, counts in runs], [1000, 8, 2])
+        self.assertEqual(compact[('w3',)], 1)
+        self.assertEqual(compact[('x3',)], 1)
+
+        # counts of the same n-gram in many runs add up
+        compact.update([('w3',), ('x3',)])
+        self.assertEqual(compact[('w3',)], 2)
+        self.assertEqual(compact[('x3',)], 2)
+        self.assertEqual([len(counts) for _, counts in compact.runs[1]],
+                         [1000, 8, 4])
+
+        compact.merge()
+        self.assertEqual(len(compact.runs[1]), 1)
+        self.assertEqual(len(compact), 1010)
+        self.assertEqual(compact[('w3',)], 2)
+        self.assertEqual(compact[('x3',)], 2)
+
+    def test_index(self):
+        vocab = Vocabulary(range(3000))
+        compact = CompactCounts({(i, i + 1): i for i in range(1, 2000)}, vocab)
+        for i in range(1, 2000):
+            self.assertEqual(compact[(i, i + 1)], i)
+        self.assertEqual(compact[(0, 1)], 0)
+        self.assertEqual(compact[(2000, 2001)], 0)
+        self.assertEqual(compact[(1, 1)], 0)
+
+        # the indexes follow the new runs
+        compact.update([(2500, 2501), (1, 2)])
+        self.assertEqual(compact[(2500, 2501)], 1)
+        self.assertEqual(compact[(1, 2)], 2)
+        compact.merge()
+        self.assertEqual(compact[(2500, 2501)], 1)
+        self.assertEqual(compact[(1, 2)], 2)
+
+        # the records of (0, 1) and (1, 0) contain the one of (1, 1)
+        compact = CompactCounts({(0, 1): 1, (1, 0): 1}, vocab)
+        self.assertEqual(compact[(1, 1)], 0)
+        self.assertEqual(compact[(1, 0)], 1)
+
+    def test_merge_runs(self):
+        items1 = {(i,): i for i in range(0, 300, 3)}
+        items2 = {(i,): 1 for i in range(0, 300, 7)}
+        expected = dict(items1)
+        for ngram, c in items2.items():
+            expected[ngram] = expected.get(ngram, 0) + c
+        vocab = Vocabulary(range(300))
+        run1 = CompactCounts(items1, vocab).runs[1][0]
+        run2 = CompactCounts(items2, vocab).runs[1][0]
+
+        for a, b in [(run1, run2), (run2, run1)]:
+            records, counts = counts_module.merge_runs(a, b, 4)
+            self.assertEqual(len(records), 4 * len(counts))
+            merged = {(int.from_bytes(records[4 * i: 4 * i + 4], 'big'),): c
+                      for i, c in enumerate(counts)}
+            self.assertEqual(merged, expected)
+
+    def test_ngram_compact(self):
+        for n in [1, 2, 3]:
+            ngram = NGram(n, self.sents)
+            compact = NGram(n, self.sents, compact=True)
+
+            self.assertEqual(dict(compact.counts.items()), dict(ngram.counts))
+            for sent in self.sents + ['el gato come salame .'.split()]:
+                self.assertEqual(compact.sent_log_prob(sent),
+                                 ngram.sent_log_prob(sent))
+
+    def test_large_vocabulary(self):
+        # 5-grams of 5000 token ids do not fit in 64 bits
+        words = ['w{}'.format(i) for i in range(5000)]
+        sents = [words[i: i + 10] for i in range(0, len(words), 10)]
+        ngram = NGram(5, sents)
+        compact = NGram(5, sents, compact=True)
+
+        self.assertEqual(dict(compact.counts.items()), dict(ngram.counts))
+        sent = ['w4990', 'w4991', 'w4992', 'w4993', 'w4994']
+        self.assertEqual(compact.count(sent), 1)
+        self.assertEqual(compact.successors(sent[1:]), [('w4995', 1)])
+
+    def test_pickle(self):
+        compact = NGram(2, self.sents, compact=True)
+        compact2 = pickle.loads(pickle.dumps(compact))
+
+        self.assertEqual(dict(compact2.counts.items()),
+                         dict(compact.counts.items()))
+
+
+class TestDiskCounts(TestCase):
+
+    def setUp(self):
+        self.sents = [
+            'el gato come pescado .'.split(),
+            'la gata come salmón .'.split(),
+        ]
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_runs(self):
+        ngram = NGram(3, self.sents)
+        ngrams = list(ngram.ngrams(self.sents))
+
+        check_every = counts_module.CHECK_EVERY
+        counts_module.CHECK_EVERY = 1
+        try:
+            # a budget of one pending n-gram gives one run per n-gram
+            disk = DiskCounts(self.tmpdir.name, memory=1)
+            disk.update(ngrams[:10])
+            disk.update(ngrams[10:])
+        finally:
+            counts_module.CHECK_EVERY = check_every
+
+        self.assertTrue(len(disk.runs[3]) > 1)
+        self.assertEqual(dict(disk.items()), dict(ngram.counts))
+        self.assertEqual(len(disk.runs[3]), 1)
+        self.assertEqual(len(disk), len(ngram.counts))
+
+        for gram, c in ngram.counts.items():
+            self.assertEqual(disk[gram], c, gram)
+        self.assertEqual(disk[('come', 'salame')], 0)
+        self.assertEqual(disk[('come', 'come')], 0)
+        disk.close()
+
+    def test_ngram_disk(self):
+        ngram = NGram(2, self.sents)
+        disk = NGram(2, self.sents, memory=2 ** 20, path=self.tmpdir.name)
+
+        for sent in self.sents + ['el gato come salame .'.split()]:
+            self.assertEqual(disk.sent_log_prob(sent),
+                             ngram.sent_log_prob(sent))
+
+        # update after merging and pickle
+        ngram.update(self.sents)
+        disk.update(self.sents)
+        disk2 = pickle.loads(pickle.dumps(disk))
+        self.assertEqual(dict(disk2.counts.items()), dict(ngram.counts))
+        disk.counts.close()
+        disk2.counts.close()
+
+    def test_relative_path(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        try:
+            disk = NGram(2, self.sents, memory=2 ** 20, path='tables')
+            data = pickle.dumps(disk)
+            disk.counts.close()
+            os.mkdir('other')
+            os.chdir('other')
+            disk2 = pickle.loads(data)
+            self.assertEqual(disk2.count(('el', 'gato')), 1)
+            disk2.counts.close()
+        finally:
+            os.chdir(cwd)
+
+    def test_no_workers(self):
+        # the processes would not keep the memory budget
+        with self.assertRaises(ValueError):
+            NGram(2, self.sents, memory=2 ** 20, path=self.tmpdir.name,
+                  workers=2)
+        disk = NGram(2, self.sents, memory=2 ** 20, path=self.tmpdir.name)
+        with self.assertRaises(ValueError):
+            disk.update(self.sents, workers=2)
+        disk.counts.close()
+
+    def test_successors(self):
+        ngram = NGram(3, self.sents)
+        disk = NGram(3, self.sents, memory=2 ** 20, path=self.tmpdir.name)
+
+        for prev in [('<s>', '<s>'), ('gato', 'come'), ('come', 'salame')]:
+            self.assertEqual(set(disk.successors(prev)),
+                             set(ngram.successors(prev)))
+        self.assertEqual(disk.successors(('<s>', '<s>')),
+                         [('el', 1), ('la', 1)])
+        disk.counts.close()
+
+    def test_temporary(self):
+        disk = DiskCounts(memory=2 ** 20)
+        disk.update([('el', 'gato'), ('el', 'gato')])
+        path = disk.path
+
+        self.assertEqual(disk[('el', 'gato')], 2)
+        self.assertTrue(os.path.isdir(path))
+        # the directory would not outlive the process
+        self.assertRaises(TypeError, pickle.dumps, disk)
+        disk.cleanup()
+        self.assertFalse(os.path.exists(path))
+
+        # also removed when garbage collected
+        disk = DiskCounts(memory=2 ** 20)
+        disk.update([('el', 'gato')])
+        path = disk.path
+        self.assertEqual(disk[('el', 'gato')], 1)
+        disk.close()
+        del disk
+        self.assertFalse(os.path.exists(path))
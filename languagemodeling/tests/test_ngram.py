@@ -140,3 +140,104 @@ class TestNGram(TestCase):
         }
         for sent, prob in sents.items():
             self.assertAlmostEqual(ngram.sent_log_prob(sent.split()), prob, msg=sent)
+
+    def test_update(self):
+        for compact in [False, True]:
+            ngram = NGram(2, self.sents, compact=compact)
+
+            # a model trained on one sentence and updated with the other one
+            # has the same counts as a model trained on both sentences:
+            ngram2 = NGram(2, self.sents[:1], compact=compact)
+            ngram2.update(iter(self.sents[1:]))
+
+            self.assertEqual(dict(ngram2.counts.items()),
+                             dict(ngram.counts.items()))
+
+    def test_parallel_counts(self):
+        sents = self.sents * 5
+        for n in [1, 2, 3]:
+            for compact in [False, True]:
+                ngram = NGram(n, sents, compact=compact)
+                ngram2 = NGram(n, sents, compact=compact, workers=2)
+                # many chunks per worker:
+                ngram3 = NGram(n, [], compact=compact)
+                ngram3.update(iter(sents), workers=2, chunk_size=3)
+                if compact:
+                    # the disjoint runs of the workers are concatenated
+                    for runs in ngram3.counts.runs.values():
+                        self.assertEqual(len(runs), 1)
+                # update of a model with counts:
+                ngram4 = NGram(n, sents[:4], compact=compact)
+                ngram4.update(iter(sents[4:]), workers=3, chunk_size=2)
+                ngrams = [ngram2, ngram3, ngram4]
+                if compact:
+                    # the workers freeze their tables after every shard
+                    ngram5 = NGram(n, [], compact=True)
+                    ngram5.counts.max_pending = 1
+                    ngram5.update(iter(sents), workers=2, chunk_size=3)
+                    ngrams.append(ngram5)
+
+                counts = dict(ngram.counts.items())
+                for ngram_i in ngrams:
+                    self.assertEqual(dict(ngram_i.counts.items()), counts)
+
+    def test_batch_log_prob(self):
+        sents = [s.split() for s in [
+            'el gato come pescado .',
+            'la gata come salmón .',
+            'el gato come salmón .',
+            'el gato come salame .',
+            'la la la',
+            '',
+        ]]
+        for n in [1, 2, 3]:
+            for compact in [False, True]:
+                ngram = NGram(n, self.sents, compact=compact)
+
+                log_probs = [ngram.sent_log_prob(sent) for sent in sents]
+                self.assertEqual(ngram.batch_log_prob(sents), log_probs)
+
+    def test_successors(self):
+        successors = {
+            ('<s>',): {('el', 1), ('la', 1)},
+            ('come',): {('pescado', 1), ('salmón', 1)},
+            ('.',): {('</s>', 2)},
+            ('</s>',): set(),
+            ('salame',): set(),
+        }
+        for compact in [False, True]:
+            ngram = NGram(2, self.sents, compact=compact)
+            for prev, s in successors.items():
+                self.assertEqual(set(ngram.successors(prev)), s, prev)
+
+            # the index is rebuilt after an update
+            ngram.update(self.sents[:1])
+            self.assertEqual(set(ngram.successors(('<s>',))),
+                             {('el', 2), ('la', 1)})
+
+        ngram = NGram(1, self.sents, compact=True)
+        self.assertEqual(len(ngram.successors(())), 9)
+
+    def test_score(self):
+        sents = [s.split() for s in [
+            'el gato come pescado .',
+            'el gato come salame .',
+            'la la la',
+        ]]
+        for n in [1, 2, 3]:
+            ngram = NGram(n, self.sents)
+            for sent in sents:
+                state = ngram.start_state()
+                log_prob = 0.0
+                for token in sent + ['</s>']:
+                    lp, state = ngram.score(state, token)
+                    log_prob += lp
+                self.assertEqual(log_prob, ngram.sent_log_prob(sent))
+                self.assertEqual(len(state), n - 1)
+
+        # states are reusable: extend the same prefix in two ways
+        ngram = NGram(2, self.sents)
+        _, state = ngram.score(ngram.start_state(), 'el')
+        lp1, _ = ngram.score(state, 'gato')
+        lp2, _ = ngram.score(state, 'gata')
+        self.assertEqual((lp1, lp2), (0.0, float('-inf')))
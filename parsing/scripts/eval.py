@@ -1,11 +1,13 @@
 """Evaulate a parser.
 
 Usage:
-  eval.py -i <file>
+  eval.py -i <file> [-c <dir>] [-w <w>]
   eval.py -h | --help
 
 Options:
   -i <file>     Parsing model file.
+  -c <dir>      Cache directory for the converted corpus.
+  -w <w>        Number of processes used to load the corpus [default: 1].
   -h --help     Show this screen.
 """
 from docopt import docopt
@@ -36,7 +38,9 @@ if __name__ == '__main__':
 
     print('Loading corpus...')
     files = '3LB-CAST/.*\.tbf\.xml'
-    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files)
+    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files,
+                                      cache=opts['-c'],
+                                      workers=int(opts['-w']))
     parsed_sents = list(corpus.parsed_sents())
 
     print('Parsing...')
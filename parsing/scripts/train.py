@@ -1,7 +1,7 @@
 """Train a parser.
 
 Usage:
-  train.py [-m <model>] -o <file>
+  train.py [-m <model>] [-c <dir>] [-w <w>] -o <file>
   train.py -h | --help
 
 Options:
@@ -9,6 +9,8 @@ Options:
                   flat: Flat trees
                   rbranch: Right branching trees
                   lbranch: Left branching trees
+  -c <dir>      Cache directory for the converted corpus.
+  -w <w>        Number of processes used to load the corpus [default: 1].
   -o <file>     Output model file.
   -h --help     Show this screen.
 """
@@ -32,7 +34,9 @@ if __name__ == '__main__':
 
     print('Loading corpus...')
     files = 'CESS-CAST-(A|AA|P)/.*\.tbf\.xml'
-    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files)
+    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files,
+                                      cache=opts['-c'],
+                                      workers=int(opts['-w']))
 
     print('Training model...')
     model = models[opts['-m']](corpus.parsed_sents())
@@ -1,16 +1,19 @@
 """Evaulate a tagger.
 
 Usage:
-  eval.py -i <file>
+  eval.py -i <file> [-c <dir>] [-w <w>]
   eval.py -h | --help
 
 Options:
   -i <file>     Tagging model file.
+  -c <dir>      Cache directory for the converted corpus.
+  -w <w>        Number of processes used to load the corpus [default: 1].
   -h --help     Show this screen.
 """
 from docopt import docopt
 import pickle
 import sys
+import time
 
 from corpus.ancora import SimpleAncoraCorpusReader
 
@@ -34,16 +37,21 @@ if __name__ == '__main__':
 
     # load the data
     files = '3LB-CAST/.*\.tbf\.xml'
-    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files)
+    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files,
+                                      cache=opts['-c'],
+                                      workers=int(opts['-w']))
     sents = list(corpus.tagged_sents())
 
     # tag
     hits, total = 0, 0
     n = len(sents)
+    tagging_time = 0.0
     for i, sent in enumerate(sents):
         word_sent, gold_tag_sent = zip(*sent)
 
+        start = time.time()
         model_tag_sent = model.tag(word_sent)
+        tagging_time += time.time() - start
         assert len(model_tag_sent) == len(gold_tag_sent), i
 
         # global score
@@ -58,3 +66,6 @@ if __name__ == '__main__':
 
     print('')
     print('Accuracy: {:2.2f}%'.format(acc * 100))
+    tagging_time = max(tagging_time, 1e-6)
+    print('Tagging time: {:.2f}s ({:.0f} sents/s, {:.0f} tokens/s)'.format(
+        tagging_time, n / tagging_time, total / tagging_time))
@@ -1,13 +1,19 @@
 """Print corpus statistics.
 
+The corpus is read in a single streaming pass, without keeping the
+sentences in memory.
+
 Usage:
-  stats.py
+  stats.py [-c <dir>] [-t <n>]
   stats.py -h | --help
 
 Options:
+  -c <dir>      Cache directory for the converted corpus.
+  -t <n>        Number of most frequent tags to show [default: 10].
   -h --help     Show this screen.
 """
 from docopt import docopt
+from collections import Counter
 
 from corpus.ancora import SimpleAncoraCorpusReader
 
@@ -15,9 +21,25 @@ from corpus.ancora import SimpleAncoraCorpusReader
 if __name__ == '__main__':
     opts = docopt(__doc__)
 
-    # load the data
-    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/')
-    sents = list(corpus.tagged_sents())
+    # stream the data (the cache, if given, is read file by file)
+    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', cache=opts['-c'],
+                                      stream=True)
+
+    # compute the statistics in one pass
+    n_sents = 0
+    words = Counter()
+    tags = Counter()
+    for sent in corpus.tagged_sents():
+        n_sents += 1
+        for word, tag in sent:
+            words[word] += 1
+            tags[tag] += 1
+    n_tokens = sum(words.values())
 
-    # compute the statistics
-    print('sents: {}'.format(len(sents)))
+    print('sents: {}'.format(n_sents))
+    print('tokens: {}'.format(n_tokens))
+    print('words: {}'.format(len(words)))
+    print('tags: {}'.format(len(tags)))
+    print('most frequent tags:')
+    for tag, count in tags.most_common(int(opts['-t'])):
+        print('  {}\t{}\t{:.2f}%'.format(tag, count, 100.0 * count / n_tokens))
@@ -1,12 +1,14 @@
 """Train a sequence tagger.
 
 Usage:
-  train.py [-m <model>] -o <file>
+  train.py [-m <model>] [-c <dir>] [-w <w>] -o <file>
   train.py -h | --help
 
 Options:
   -m <model>    Model to use [default: base]:
                   base: Baseline
+  -c <dir>      Cache directory for the converted corpus.
+  -w <w>        Number of processes used to load the corpus [default: 1].
   -o <file>     Output model file.
   -h --help     Show this screen.
 """
@@ -27,7 +29,9 @@ if __name__ == '__main__':
 
     # load the data
     files = 'CESS-CAST-(A|AA|P)/.*\.tbf\.xml'
-    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files)
+    corpus = SimpleAncoraCorpusReader('ancora/ancora-2.0/', files,
+                                      cache=opts['-c'],
+                                      workers=int(opts['-w']))
     sents = list(corpus.tagged_sents())
 
     # train the model